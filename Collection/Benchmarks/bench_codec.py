@@ -0,0 +1,83 @@
+"""
+Benchmark the lossless session codec: compression ratio against encode/decode throughput.
+    -s --source: "cyton" (simulated 24-bit ADC counts, default) or "synthetic" (BrainFlow synthetic board)
+    -b --board: Board id used for row layout and ADC scales (default 2, Cyton/Daisy)
+    -t --seconds: Seconds of data per chunk (default 5, the GUI's drain latency)
+    -j --json: Optional path for machine-readable results
+"""
+import argparse
+import json
+import numpy as np
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "DataGUI"))
+from brainflow.board_shim import BoardShim, BrainFlowInputParams  # noqa: E402
+from Codec import board_scales, decode, encode  # noqa: E402
+
+
+def cyton_chunk(board_id, seconds, seed=0):
+    """Rows shaped like a Cyton/Daisy drain with EEG and accel stored as exact multiples of their ADC scale"""
+    rng = np.random.default_rng(seed)
+    srate = BoardShim.get_sampling_rate(board_id)
+    rows, n = BoardShim.get_num_rows(board_id), int(srate * seconds)
+    scales = board_scales(board_id, rows)
+    chunk = np.zeros((rows, n))
+    chunk[BoardShim.get_package_num_channel(board_id)] = np.arange(n) * 2 % 256
+    eeg = BoardShim.get_eeg_channels(board_id)
+    counts = np.cumsum(rng.integers(-300, 300, (len(eeg), n)), axis=1) + rng.integers(-10 ** 5, 10 ** 5, (len(eeg), 1))
+    chunk[eeg] = counts * scales[eeg[0]]
+    accel = BoardShim.get_accel_channels(board_id)
+    chunk[accel] = rng.integers(-2000, 2000, (len(accel), n)) * scales[accel[0]]
+    chunk[BoardShim.get_timestamp_channel(board_id)] = time.time() + np.arange(n) / srate + rng.normal(0, 1e-3, n)
+    return chunk, scales
+
+
+def synthetic_chunk(seconds):
+    board = BoardShim(-1, BrainFlowInputParams())
+    board.prepare_session()
+    board.start_stream()
+    time.sleep(seconds)
+    board.stop_stream()
+    chunk = board.get_board_data()
+    board.release_session()
+    return chunk, board_scales(-1, chunk.shape[0])
+
+
+def run(chunk, scales, coder, level, repeats=5):
+    frame = encode(chunk, scales, coder, level)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        frame = encode(chunk, scales, coder, level)
+    enc = (time.perf_counter() - start) / repeats
+    start = time.perf_counter()
+    for _ in range(repeats):
+        out = decode(frame)
+    dec = (time.perf_counter() - start) / repeats
+    assert np.array_equal(out.view(np.int64), chunk.view(np.int64)), "Codec round trip was not lossless"
+    text = sum(len(" ".join("%.9f" % v for v in row)) + 1 for row in chunk)
+    return {"Coder": coder, "Level": level, "RawBytes": chunk.nbytes, "CompressedBytes": len(frame),
+            "Ratio": chunk.nbytes / len(frame), "CsvRatio": text / len(frame),
+            "EncodeMBps": chunk.nbytes / enc / 1e6, "DecodeMBps": chunk.nbytes / dec / 1e6}
+
+
+parser = argparse.ArgumentParser(prog='bench_codec.py', description='Benchmarks the lossless session codec')
+parser.add_argument('-s', '--source', choices=("cyton", "synthetic"), default="cyton")
+parser.add_argument('-b', '--board', type=int, default=2)
+parser.add_argument('-t', '--seconds', type=float, default=5)
+parser.add_argument('-j', '--json', help="Path for machine-readable results")
+args = parser.parse_args()
+
+chunk, scales = cyton_chunk(args.board, args.seconds) if args.source == "cyton" else synthetic_chunk(args.seconds)
+results = [run(chunk, scales, coder, level) for coder, level in
+           (("zlib", 1), ("zlib", 6), ("bz2", 9), ("lzma", 1), ("lzma", 6))]
+
+print(f"{chunk.shape[0]} rows x {chunk.shape[1]} samples ({args.source})")
+print(f"{'coder':>6} {'level':>5} {'ratio':>7} {'vs csv':>7} {'enc MB/s':>9} {'dec MB/s':>9}")
+for r in results:
+    print(f"{r['Coder']:>6} {r['Level']:>5} {r['Ratio']:>7.2f} {r['CsvRatio']:>7.2f} "
+          f"{r['EncodeMBps']:>9.1f} {r['DecodeMBps']:>9.1f}")
+if args.json:
+    with open(args.json, 'w') as f:
+        json.dump({"Source": args.source, "Shape": list(chunk.shape), "Results": results}, f, indent=4)
@@ -0,0 +1,180 @@
+"""
+Benchmark the collection path (CollectionSession.update_data and the writer thread) across session length, board
+channel count, drain interval and storage format. Each configuration runs in its own process so peak memory is
+measured per run.
+    -l --lengths: Session lengths in minutes (default 1,10,60)
+    -b --boards: Board ids, 0 = Cyton (8 EEG), 2 = CytonDaisy (16 EEG + aux rows) (default 0,2)
+    -d --drains: Drain intervals in seconds (default 0.1,1,5)
+    -f --formats: Storage formats: raw, float32, eeg (EEG + timing + markers only), zlib, lzma,
+        tail (60 s in memory) (default raw,zlib)
+    -r --realtime: Stream from BrainFlow's synthetic board in real time instead of replaying DataSim chunks
+    -e --export: Include the data.csv export in each run
+    -j --json: Optional path for machine-readable results
+"""
+import argparse
+import itertools
+import json
+import numpy as np
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "DataGUI"))
+from brainflow.board_shim import BoardShim, BrainFlowInputParams  # noqa: E402
+from BoardBridge import CollectionSession  # noqa: E402
+from DataSim import DataSim  # noqa: E402
+from ProcessStats import peak_rss  # noqa: E402
+from SessionWriter import export_csv  # noqa: E402
+
+FORMATS = {  # name: CollectionSession keyword arguments
+    "raw": {},
+    "float32": {"dtype": np.float32},
+    "eeg": {"rowgroups": ("EEG", "Timestamp", "Marker")},
+    "zlib": {"codec": "zlib"},
+    "lzma": {"codec": "lzma"},
+    "tail": {"memory_seconds": 60},
+}
+
+
+class ReplayBoard:
+    """BoardShim stand-in that hands out DataSim chunks as fast as they are drained, without waiting"""
+    def __init__(self, board_id, drain):
+        self.board_id = board_id
+        self.sim = DataSim(board_id, seed=0)
+        self.sim.start_time = time.time()
+        self.per_drain = max(1, int(drain * self.sim.srate))
+        self.index = 0
+
+    def get_board_data(self):
+        chunk = self.sim.generate(self.index, self.per_drain)
+        self.index += self.per_drain
+        return chunk
+
+    def get_board_data_count(self):
+        return self.per_drain
+
+    def is_prepared(self):
+        return True
+
+    def log_message(self, level, message):
+        pass
+
+    def start_stream(self, buffsize):
+        pass
+
+    def stop_stream(self):
+        pass
+
+    def release_session(self):
+        pass
+
+
+class TimedSession(CollectionSession):
+    """CollectionSession that records how long each drain takes"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latencies = []
+
+    def update_data(self):
+        start = time.perf_counter()
+        super().update_data()
+        self.latencies.append(time.perf_counter() - start)
+
+
+def directory_bytes(path):
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+
+
+def run_replay(config, sespath):
+    board = ReplayBoard(config['Board'], config['Drain'])
+    session = TimedSession(board, sespath, 450000, max_latency=config['Drain'], **FORMATS[config['Format']])
+    session.ready_flag.set()
+    session.start_stream()
+    start = time.perf_counter()
+    for _ in range(int(config['Minutes'] * 60 / config['Drain'])):
+        session.update_data()
+        if session.error_flag.is_set():
+            raise RuntimeError(session.get_error())
+    return session, start
+
+
+def run_realtime(config, sespath):
+    board = BoardShim(-1, BrainFlowInputParams())
+    session = TimedSession(board, sespath, 450000, max_latency=config['Drain'], **FORMATS[config['Format']])
+    session.start()
+    session.ready_flag.wait()
+    session.start_event.set()
+    start = time.perf_counter()
+    time.sleep(config['Minutes'] * 60)
+    session.finalize_data = lambda: None  # Timed below instead
+    session.stop_event.set()
+    session.join()
+    board.release_session()
+    return session, start
+
+
+def run(config):
+    """Run one configuration and return its measurements"""
+    sespath = tempfile.mkdtemp(prefix="ndbench_")
+    try:
+        session, start = (run_realtime if config['Realtime'] else run_replay)(config, sespath)
+        collect = time.perf_counter() - start
+        final = time.perf_counter()
+        session.writer.close()
+        if config['Export']:
+            export_csv(sespath)
+        finalize = time.perf_counter() - final
+        lat = np.array(session.latencies) * 1000
+        samples = session.store.count
+        return dict(config, Drains=len(lat), Samples=samples, Rows=session.store.rows,
+                    LatencyP50ms=float(np.percentile(lat, 50)), LatencyP95ms=float(np.percentile(lat, 95)),
+                    LatencyP99ms=float(np.percentile(lat, 99)), LatencyMaxms=float(lat.max()),
+                    SamplesPerSecond=samples / collect, FinalizeSeconds=finalize,
+                    BytesWritten=directory_bytes(sespath), BytesPerSample=directory_bytes(sespath) / max(1, samples),
+                    PeakRSS=peak_rss(), SamplesLost=session.integrity.lost,
+                    WriterStalls=session.writer.metrics.full_events)
+    finally:
+        shutil.rmtree(sespath, ignore_errors=True)
+
+
+parser = argparse.ArgumentParser(prog='bench_collection.py', description='Benchmarks the collection path')
+parser.add_argument('-l', '--lengths', default="1,10,60", help="Session lengths in minutes")
+parser.add_argument('-b', '--boards', default="0,2", help="Board ids")
+parser.add_argument('-d', '--drains', default="0.1,1,5", help="Drain intervals in seconds")
+parser.add_argument('-f', '--formats', default="raw,zlib", help=f"Storage formats ({', '.join(FORMATS)})")
+parser.add_argument('-r', '--realtime', action='store_true')
+parser.add_argument('-e', '--export', action='store_true')
+parser.add_argument('-j', '--json', help="Path for machine-readable results")
+parser.add_argument('--run', help=argparse.SUPPRESS)  # One configuration as JSON, used for the per-run process
+args = parser.parse_args()
+
+if args.run:
+    print(json.dumps(run(json.loads(args.run))))
+    sys.exit(0)
+
+boards = [-1] if args.realtime else [int(b) for b in args.boards.split(",")]
+configs = [{"Minutes": float(m), "Board": b, "Drain": float(d), "Format": f, "Realtime": args.realtime,
+            "Export": args.export}
+           for m, b, d, f in itertools.product(args.lengths.split(","), boards, args.drains.split(","),
+                                               args.formats.split(","))]
+results = []
+print(f"{'min':>6} {'board':>5} {'drain':>5} {'format':>7} {'rows':>4} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} "
+      f"{'max ms':>7} {'B/sample':>8} {'peak MB':>8} {'lost':>5}")
+for config in configs:
+    proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--run", json.dumps(config)],
+                          capture_output=True, text=True)
+    if proc.returncode:
+        print(f"Run failed: {config}\n{proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else ''}")
+        continue
+    r = json.loads(proc.stdout.strip().splitlines()[-1])
+    results.append(r)
+    print(f"{r['Minutes']:>6g} {r['Board']:>5} {r['Drain']:>5g} {r['Format']:>7} {r['Rows']:>4} "
+          f"{r['LatencyP50ms']:>7.2f} {r['LatencyP95ms']:>7.2f} {r['LatencyP99ms']:>7.2f} {r['LatencyMaxms']:>7.2f} "
+          f"{r['BytesPerSample']:>8.1f} {(r['PeakRSS'] or 0) / 2 ** 20:>8.1f} {r['SamplesLost']:>5}")
+if args.json:
+    with open(args.json, 'w') as f:
+        json.dump({"Machine": {"Platform": sys.platform, "Python": sys.version.split()[0], "CPUs": os.cpu_count()},
+                   "Results": results}, f, indent=4)
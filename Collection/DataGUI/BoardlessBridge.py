@@ -1,9 +1,23 @@
 """Classes to simulate board connection to the GUI"""
 from brainflow import LogLevels, BrainFlowError
 from brainflow.board_shim import BoardShim
+from ClockModel import ClockModel
 from DataSim import DataSim
+from DrainScheduler import DrainScheduler
+from Integrity import GapDetector
+from Journal import Journal
+from Markers import MarkerTable
+from ProcessStats import format_bytes, peak_rss
+from SampleStore import SampleStore, TailStore
+from SessionInfo import append_annotation, finalize_info
+from SessionWriter import (BIN_NAME, BinaryWriter, CompressedWriter, WriterThread, board_header, read_range,
+                           restore_timestamps, select_rows)
+from SharedRing import RingPublisher
+from StreamServer import StreamServer
+from enum import Enum
 from threading import Thread, Event, Lock
-from time import sleep
+from time import time
+from time import sleep  # Remove
 
 import numpy as np
 import os
@@ -11,12 +25,40 @@ import random  # Remove
 
 
 class ExceptableThread(Thread):
+    """Thread that keeps exceptions raised by its target and sets `done` (if given) when it finishes"""
+    def __init__(self, *args, done=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.done = done
+        self.finished = False
+
     def run(self):
         self.exc = None
         try:
             self.ret = self._target(*self._args, **self._kwargs)
         except BaseException as e:
             self.exc = e
+        finally:
+            self.finished = True
+            if self.done:
+                self.done.set()
+
+
+class WakeEvent(Event):
+    """
+    Event that also sets a shared wake event, so one thread can block on several events at once.
+    on_set, if given, is called the first time the event is set.
+    """
+    def __init__(self, wake, on_set=None):
+        super().__init__()
+        self.wake = wake
+        self.on_set = on_set
+
+    def set(self):
+        first = not self.is_set()
+        super().set()
+        self.wake.set()
+        if first and self.on_set:
+            self.on_set()
 
 
 class CollectionSession(Thread):
@@ -30,25 +72,152 @@ class CollectionSession(Thread):
     sespath: str
         Path to directory where data, info, and log files will be stored
     buffsize: Size of on-board data buffer in samples
+    watermark: float
+        Fraction of buffsize at which the board buffer is drained
+    max_latency: float
+        Longest time in seconds between drains
+    codec: str
+        Optional lossless coder for data.bin ("zlib", "bz2" or "lzma"), None stores raw samples
+    rowgroups: sequence
+        Row groups to keep (keys of SessionWriter.ROW_GROUPS), None keeps every row BrainFlow returns
+    dtype: numpy dtype
+        Storage type of the kept rows in memory and in data.bin
+    memory_seconds: float
+        Seconds of recent data kept in RAM, older samples are only read back from data.bin.
+        None keeps the whole session in memory.
+    publish: str
+        Optional shared memory name. Drained chunks are then also published to a SharedRing.RingPublisher
+        so other local processes can read live samples.
+    serve: str
+        Optional "host:port" or Unix socket path. Drained chunks are then streamed to subscribers
+        (StreamServer.StreamClient) as framed binary chunks.
+    sync_every: int
+        Drains between fsyncs of data.bin and session.journal (0 disables the drain count trigger)
+    sync_interval: float
+        Longest time in seconds between fsyncs while drains are pending (0 disables the time trigger)
+    flush_every: int
+        Drains between flushes of data.bin to the OS (0 leaves flushing to the file buffer)
+    fsync: bool
+        Whether every flush is also forced to disk, on top of the journal's cadence
     """
     class PrepInterruptedException(Exception):
         """Raised by user closing the window during board preparation."""
 
-    def __init__(self, boardshim: BoardShim, sespath, buffsize):
+    class State(Enum):
+        PREPARING = "Preparing"
+        READY = "Ready"
+        STREAMING = "Streaming"
+        STOPPED = "Stopped"
+        FAILED = "Failed"
+
+    def __init__(self, boardshim: BoardShim, sespath, buffsize, watermark=0.5, max_latency=5.0, codec=None,
+                 rowgroups=None, dtype=np.float64, memory_seconds=None,
+                 publish=None, serve=None, sync_every=1, sync_interval=5.0, flush_every=1, fsync=False):
         super().__init__(name="CollectionThread")
         self.lock = Lock()
         self.board = boardshim
         self.buffsize = buffsize
         self.sespath = sespath
-        self.fname = "data.csv"
-        self.ready_flag, self.ongoing, self.error_flag = Event(), Event(), Event()
-        self.start_event, self.stop_event = Event(), Event()
+        self.wake = Event()  # Set whenever start, stop, or error is requested so waits return immediately
+        # Called as listener(state, error message) on every state change and when an error is flagged
+        self.listeners = []
+        self.ready_flag, self.ongoing, self.error_flag = Event(), Event(), WakeEvent(self.wake, self.notify)
+        self.start_event, self.stop_event = WakeEvent(self.wake), WakeEvent(self.wake)
+        self.state = CollectionSession.State.PREPARING
         self.error_message = ""
         self.lfpath = None
 
-        rows = BoardShim.get_num_rows(self.board.board_id)
-        self.data = np.zeros((rows, 1))
-        self.sim = DataSim(rows)  # Remove
+        self.rows = select_rows(self.board.board_id, rowgroups)
+        self.project = len(self.rows) != BoardShim.get_num_rows(self.board.board_id)  # False when keeping every row
+        self.dtype = np.dtype(dtype)
+        ts_row = BoardShim.get_timestamp_channel(self.board.board_id)
+        # Unix timestamps need float64, so narrower types store them relative to TimestampOrigin (see select)
+        self.ts_index = self.rows.index(ts_row) if self.dtype.itemsize < 8 and ts_row in self.rows else None
+        srate = BoardShim.get_sampling_rate(self.board.board_id)
+        if memory_seconds:
+            self.store = TailStore(len(self.rows), srate, memory_seconds, self.dtype)
+        else:
+            self.store = SampleStore(len(self.rows), srate, dtype=self.dtype)
+        self.scheduler = DrainScheduler(buffsize, srate, watermark, max_latency)
+        self.integrity = GapDetector(self.board.board_id, srate)
+        self.journal = Journal(sespath, sync_every, sync_interval)
+        try:
+            marker_row = BoardShim.get_marker_channel(self.board.board_id)
+        except BrainFlowError:
+            marker_row = None
+        self.markers = MarkerTable(sespath, marker_row, ts_row)
+        self.ts_row = ts_row
+        self.clock = ClockModel(srate)
+        self.annotation_lock = Lock()
+        self.annotating = True  # Cleared under annotation_lock before annotations.jsonl is merged into info.json
+        self.header = header = board_header(self.board.board_id, srate, self.rows, self.dtype, rowgroups)
+        if self.ts_index is not None:  # Fixed before the writer, ring and stream server copy the header
+            header['TimestampOrigin'] = float(int(time()))
+        if codec:
+            writer = CompressedWriter(sespath, header, codec, flush_every=flush_every, fsync=fsync,
+                                      journal=self.journal)
+        else:
+            writer = BinaryWriter(sespath, header, flush_every, fsync, journal=self.journal)
+        self.writer = WriterThread(writer)
+        self.ring = None
+        if publish:
+            channels = {key: header[key] for key in ("RowIndices", "RowGroups", "DataType", "Channels",
+                                                     "TimestampOrigin") if key in header}
+            self.ring = RingPublisher(publish, len(self.rows), srate, dtype=self.dtype,
+                                      board_id=self.board.board_id, channels=channels)
+        self.server = None
+        if serve:
+            self.server = StreamServer(serve, {key: val for key, val in header.items() if key != "Samples"})
+            self.server.start()
+        self.sim = DataSim(self.board.board_id)  # Remove
+
+    @property
+    def data(self):
+        """Samples held in memory: the whole session, or only the recent tail when memory_seconds is set"""
+        return self.store.view()
+
+    def latest(self, n):
+        """
+        Consistent no-copy view of the newest n samples, safe to call from any thread while collecting.
+        With memory_seconds set, a view of k samples is overwritten once the tail length minus k more samples
+        arrive. Take it with range instead to get its first index and check it with valid.
+        """
+        return self.store.latest(n)
+
+    def range(self, start, stop):
+        """Consistent no-copy view of session samples [start, stop) as (first index, view), see latest"""
+        return self.store.range(start, stop)
+
+    def valid(self, first):
+        """True while a view whose first sample has session index `first` is still intact"""
+        return self.store.holds(first)
+
+    @property
+    def samples(self):
+        """Samples collected so far"""
+        return self.store.count
+
+    def recent(self, seconds):
+        """
+        Last `seconds` of data, reading samples older than the in-memory tail back from data.bin. Timestamps are
+        absolute, so float32 sessions come back as float64 (see SessionWriter.restore_timestamps).
+        """
+        n = int(seconds * self.store.srate)
+        while True:
+            count = self.store.count
+            first = max(0, count - n)
+            held, tail = self.store.range(first, count)
+            if held == first:
+                return restore_timestamps(self.header, tail)
+            tail = tail.copy()  # Older than the tail, so the next append would overwrite the view
+            if self.valid(held):
+                break
+        if not self.writer.wait_written(held):
+            raise RuntimeError(f"Samples before {held} have not been written to {BIN_NAME} yet.")
+        disk = read_range(self.sespath, first, held)
+        if disk.shape[1] != held - first:
+            raise RuntimeError(f"{BIN_NAME} holds {disk.shape[1]} of samples {first}-{held - 1}.")
+        return np.hstack((disk, restore_timestamps(self.header, tail)))
 
     def activate_logger(self, fpath):
         """Configure board logger to accept custom messages and log at INFO"""
@@ -60,6 +229,7 @@ class CollectionSession(Thread):
         """Log custom message"""
         with self.lock:
             self.board.log_message(level, message)
+        self.journal.log(message)
 
     def prepare(self):
         """Prepare board for collection. Sets error flag upon failure, ready flag on success."""
@@ -70,11 +240,14 @@ class CollectionSession(Thread):
         try:
             # ExceptableThread allows calling thread to access exceptions encountered in child thread
             # proc = ExceptableThread(target=self.board.prepare_session, daemon=True, name="PrepThread")  # Uncomment
-            proc = ExceptableThread(target=sleep, daemon=True, args=(5,), name="PrepThread")   # Remove
+            proc = ExceptableThread(target=sleep, daemon=True, args=(5,), name="PrepThread", done=self.wake)   # Remove
             proc.start()
-            while proc.is_alive():  # Checks for interruption by threads other than PrepThread (probably a window close)
+            while not proc.finished:  # Blocks until PrepThread finishes or another thread (probably a window close) interrupts
+                self.wake.wait()
+                self.wake.clear()
                 if self.stop_event.is_set() or self.error_flag.is_set():
                     raise CollectionSession.PrepInterruptedException("Board preparation interrupted.")
+            proc.join()
             if self.board.is_prepared() or True:  # Remove second part
                 self.ready_flag.set()
                 self.log_message(LogLevels.LEVEL_INFO, "[GUI]: Board preparation successful.")
@@ -96,8 +269,13 @@ class CollectionSession(Thread):
         self.log_message(LogLevels.LEVEL_INFO, "[GUI]: Stream started.")
         if not self.ready_flag.is_set():
             return
-        # self.board.start_stream()  # Uncomment
-        self.sim.start_stream()  # Remove
+        self.journal.record_info(os.path.join(self.sespath, "info.json"))
+        if self.clock.origin is None:  # The GUI sets it to the time its session clock starts
+            self.clock.origin = time()
+        self.writer.start()
+        self.scheduler.reset()
+        # self.board.start_stream(self.buffsize)  # Uncomment
+        self.sim.start_stream(self.buffsize)  # Remove
 
     def update_data(self):
         try:
@@ -105,58 +283,243 @@ class CollectionSession(Thread):
                 self.error_message = "RandomError: Encountered random error."
                 self.log_message(LogLevels.LEVEL_INFO, self.error_message)
                 self.error_flag.set()
-            if not self.data.any():
-                # self.data = self.board.get_board_data()  # Uncomment
-                self.data = self.sim.get_data()  # Remove
-            else:
-                # self.data = np.hstack((self.data, self.board.get_board_data()))  # Uncomment
-                self.data = np.hstack((self.data, self.sim.get_data()))  # Remove
-            self.save_data()
-        except BrainFlowError as E:
+            # chunk = self.board.get_board_data()  # Uncomment
+            chunk = self.sim.get_data()  # Remove
+            self.check_fill(chunk.shape[1])
+            self.check_gaps(chunk)  # Needs the counter and timestamp rows, so runs before projection
+            self.markers.resolve(chunk, self.store.count)  # Needs the marker row, also before projection
+            self.clock.update(self.store.count, chunk[self.ts_row])
+            chunk = self.select(chunk)
+            self.store.append(chunk)
+            if self.ring:
+                self.ring.publish(chunk)
+            if self.server:
+                self.server.broadcast(chunk, self.store.count - chunk.shape[1])
+            self.save_data(chunk)
+        except (BrainFlowError, OSError) as E:
             self.error_message = f"Error: {E}"
             self.error_flag.set()
-            self.end_session()
-            return
+        except Exception as E:  # E.g. re-raised from the writer thread. Fail the session rather than the thread.
+            self.error_message = f"Error: {type(E).__name__}: {E}"
+            self.log_message(LogLevels.LEVEL_ERROR, f"[GUI]: {self.error_message}")
+            self.error_flag.set()
+
+    def annotate(self, time, note):
+        """
+        Append an annotation (seconds since the clock origin, note) to annotations.jsonl and mark it on the sample
+        clock. Safe to call from any thread. Returns False, saving nothing, once the session is finalizing info.json.
+        """
+        with self.annotation_lock:
+            if not self.annotating:
+                return False
+            append_annotation(self.sespath, time, note)
+            self.mark(note, "annotation")  # Before the marker table is flushed
+        return True
+
+    def mark(self, label, source="annotation"):
+        """
+        Place an event on the sample clock. Safe to call from any thread. While streaming, the event goes into the
+        board's marker channel and is resolved to its exact sample index when drained (see Markers.MarkerTable).
+        """
+        code = self.markers.request(label, source)
+        if self.markers.marker_row is not None and self.ongoing.is_set():
+            try:
+                with self.lock:
+                    # self.board.insert_marker(code)  # Uncomment
+                    self.sim.insert_marker(code)  # Remove
+                return
+            except BrainFlowError:
+                pass
+        try:
+            index = self.store.count + self.pending()
+        except BrainFlowError:
+            index = self.store.count
+        self.markers.place(code, index)
+
+    def select(self, chunk):
+        """Keep only the selected rows, converted to the storage dtype"""
+        if self.project:
+            chunk = chunk[self.rows]
+        if self.ts_index is not None and chunk.shape[1]:
+            chunk[self.ts_index] -= self.header['TimestampOrigin']
+        return chunk.astype(self.dtype, copy=False)
+
+    def pending(self):
+        """Samples waiting in the board buffer"""
+        # return self.board.get_board_data_count()  # Uncomment
+        return self.sim.get_data_count()  # Remove
+
+    def drain_wait(self):
+        """Seconds until the scheduler wants the next drain (0 if it is due now)"""
+        try:
+            return self.scheduler.wait_time(self.pending())
+        except BrainFlowError:
+            return 0  # update_data will surface the error
+
+    def check_fill(self, count):
+        """Record a drain with the scheduler and warn if the board buffer was close to overflowing"""
+        if self.scheduler.drained(count):
+            self.log_message(LogLevels.LEVEL_WARN, f"[GUI]: Board buffer {100 * count / self.buffsize:.0f}% full "
+                                                   "at drain. Samples may be dropped; raise BufferSize.")
+
+    def check_gaps(self, chunk, max_logged=5):
+        """Log samples dropped before or within the chunk"""
+        gaps = self.integrity.check(chunk)
+        for index, missing, seconds, source in gaps[:max_logged]:
+            self.log_message(LogLevels.LEVEL_WARN, f"[GUI]: ~{missing} samples lost before sample {index} "
+                                                   f"({seconds:.3f}s gap, {source}).")
+        if len(gaps) > max_logged:
+            self.log_message(LogLevels.LEVEL_WARN, f"[GUI]: {len(gaps) - max_logged} more gaps in this update.")
+
+    def save_info(self):
+        """Add the sample-loss, marker and clock summaries and the session's annotations to info.json"""
+        with self.annotation_lock:  # Later annotate calls are refused, so none land after the merge
+            self.annotating = False
+        summary = self.integrity.summary()
+        self.log_message(LogLevels.LEVEL_INFO, f"[GUI]: Integrity: {summary['SamplesLost']} of "
+                                               f"{summary['SamplesRecorded']} samples lost.")
+        self.markers.flush(self.store.count)
+        markers = self.markers.summary()
+        if markers['Count']:
+            latency = f", latency median {markers['LatencyMedianMs']:.1f} ms, p95 {markers['LatencyP95Ms']:.1f} ms" \
+                if 'LatencyMedianMs' in markers else ""
+            self.log_message(LogLevels.LEVEL_INFO, f"[GUI]: Markers: {markers['Count']} "
+                                                   f"({markers['Estimated']} estimated){latency}.")
+        clock = self.clock.summary()
+        self.log_message(LogLevels.LEVEL_INFO, f"[GUI]: Board clock {clock['EffectiveRate']:.4f} Hz "
+                                               f"({clock['DriftPPM']:+.0f} ppm from nominal).")
+        if self.clock.latest:
+            self.clock.save(self.sespath)
+        hardware = {'TimestampOrigin': str(self.header['TimestampOrigin'])} if self.ts_index is not None else None
+        if info := finalize_info(self.sespath, hardware, Integrity=summary, Markers=markers, Clock=clock):
+            self.log_message(LogLevels.LEVEL_INFO, f"[GUI]: {len(info['Annotations'])} annotations saved.")
 
-    def save_data(self):
-        np.savetxt(os.path.join(self.sespath, self.fname), np.copy(self.data), fmt="%.9f")
-        self.log_message(LogLevels.LEVEL_INFO, "[GUI]: Update saved.")
+    def save_data(self, chunk):
+        """Hand the newly drained chunk to the writer thread"""
+        if self.writer.exc:
+            raise self.writer.exc
+        self.writer.put(chunk)
+        self.log_message(LogLevels.LEVEL_INFO, "[GUI]: Update queued for writing.")
+        if self.writer.lagging():
+            self.log_message(LogLevels.LEVEL_WARN, f"[GUI]: Writer falling behind. {self.writer.metrics.summary()}")
+
+    def finalize_data(self):
+        """Flush remaining samples and close data.bin. Convert to CSV on demand with SessionWriter.export_csv."""
+        self.writer.close()
+        if self.writer.exc:
+            raise self.writer.exc
+        self.log_message(LogLevels.LEVEL_INFO, f"[GUI]: {self.writer.writer.samples} samples saved to {BIN_NAME}.")
+        self.log_message(LogLevels.LEVEL_INFO, f"[GUI]: Writer stats: {self.writer.metrics.summary()}")
+        self.log_message(LogLevels.LEVEL_INFO, f"[GUI]: Drain stats: {self.scheduler.summary()}")
+        self.log_message(LogLevels.LEVEL_INFO, f"[GUI]: Peak memory (RSS): {format_bytes(peak_rss())}.")
+        self.save_info()
+        self.close_ring()
+
+    def finish(self):
+        """finalize_data, flagging rather than raising any error so the session can still fail cleanly"""
+        try:
+            self.finalize_data()
+        except Exception as E:  # Writer errors of any type, re-raised from the writer thread
+            self.error_message = f"Error: {E}"
+            self.log_message(LogLevels.LEVEL_ERROR, f"[GUI]: Could not finalize session data: {E}")
+            self.error_flag.set()
+            self.close_ring()
 
     def run(self):
-        self.prepare()
+        """Run the session state machine until it stops or fails"""
+        transitions = {CollectionSession.State.PREPARING: self.on_preparing,
+                       CollectionSession.State.READY: self.on_ready,
+                       CollectionSession.State.STREAMING: self.on_streaming}
+        while self.state in transitions:
+            self.set_state(transitions[self.state]())
 
-        while not self.start_event.is_set() and not self.error_flag.is_set():  # In ready state
-            sleep(0.1)
-        if self.error_flag.is_set():  # Probably window closed before starting stream
-            # self.board.release_session()  # Uncomment
-            return
+    def set_state(self, state):
+        if state != self.state:
+            self.log_message(LogLevels.LEVEL_INFO, f"[GUI]: Session state {self.state.value} -> {state.value}.")
+            self.state = state
+            self.notify()
+
+    def add_listener(self, listener):
+        """
+        Call listener(state, error message) on every state change and when an error is flagged. Listeners run
+        on the thread that made the change (usually the collection thread), so GUI listeners should only post
+        an event, e.g. emit a Qt signal.
+        """
+        self.listeners.append(listener)
+
+    def notify(self):
+        for listener in self.listeners:
+            listener(self.state, self.error_message)
 
+    def on_preparing(self):
+        self.prepare()
+        if self.error_flag.is_set():
+            self.release()
+            return CollectionSession.State.FAILED
+        return CollectionSession.State.READY
+
+    def on_ready(self):
+        """Block without polling until start, stop, or error is requested"""
+        while not (self.start_event.is_set() or self.stop_event.is_set() or self.error_flag.is_set()):
+            self.wake.wait()
+            self.wake.clear()
+        if self.error_flag.is_set() or self.stop_event.is_set():  # Probably window closed before starting stream
+            self.release()
+            return CollectionSession.State.FAILED if self.error_flag.is_set() else CollectionSession.State.STOPPED
         self.start_stream()
         self.ongoing.set()
+        return CollectionSession.State.STREAMING
 
-        stopped = False
-        while not (error := self.error_flag.is_set()) and not (stopped := self.stop_event.is_set()):
-            sleep(5)
-            self.update_data()
+    def on_streaming(self):
+        """Drain when the scheduler says so, waking early for stop or error"""
+        while not (error := self.error_flag.is_set()) and not self.stop_event.is_set():
+            if wait := self.drain_wait():
+                self.wake.wait(wait)
+                self.wake.clear()
+            else:
+                self.update_data()
 
         if error:  # Error during collection (window close counted as error)
             self.end_session()
-            return
-        if stopped:  # Stopped by user or natural end of session
-            self.pause_session()  # Change to pause_session
+            return CollectionSession.State.FAILED
+        self.pause_session()  # Stopped by user or natural end of session
+        return CollectionSession.State.FAILED if self.error_flag.is_set() else CollectionSession.State.STOPPED
+
+    def release(self):
+        """Release resources held when the session fails or stops before streaming"""
+        # self.board.release_session()  # Uncomment
+        self.journal.close()
+        self.close_ring()
+
+    def close_ring(self):
+        """Stop publishing and streaming to other processes"""
+        if self.ring:
+            self.ring.close()
+            self.ring = None
+        if self.server:
+            self.log_message(LogLevels.LEVEL_INFO, f"[GUI]: Stream server: {self.server.summary()}")
+            self.server.close()
+            self.server = None
 
     def pause_session(self):
         # self.board.stop_stream()  # Uncomment
         self.sim.stop_stream()  # Remove
+        self.update_data()  # Drain samples collected since the last update
+        self.finish()
         self.ready_flag.clear()
         self.ongoing.clear()
         self.log_message(LogLevels.LEVEL_INFO, "[GUI]: Stream stopped.")
 
     def end_session(self):
-        self.save_data()
-        # self.board.stop_stream()  # Uncomment
-        # self.board.release_session()  # Uncomment
-        self.sim.stop_stream()  # Remove
+        try:
+            # self.board.stop_stream()  # Uncomment
+            self.sim.stop_stream()  # Remove
+        except BrainFlowError as E:  # Board probably already gone, which is why the session is ending
+            self.log_message(LogLevels.LEVEL_ERROR, f"[GUI]: {E}")
+        try:
+            self.finish()
+        finally:
+            self.release()
         self.ready_flag.clear()
         self.ongoing.clear()
         self.log_message(LogLevels.LEVEL_INFO, "[GUI]: Session ended.")
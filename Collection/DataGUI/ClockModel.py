@@ -0,0 +1,142 @@
+"""Mapping between host (wall-clock) time and board sample index"""
+import json
+import numpy as np
+import os
+
+CLOCK_NAME = "clock.json"
+
+
+class ClockModel:
+    """
+    Running model of the board sample clock against the host clock, fed the timestamp row of every drained
+    chunk. It keeps a least-squares fit of timestamp against session sample index, whose slope gives the
+    board's effective sampling rate (which drifts from the nominal rate), and anchor points (sample index,
+    host time) at most `spacing` seconds apart. Each anchor's time comes from the chunk's smallest offset from
+    the fitted rate: timestamps are taken when samples reach the host, so serial bursts only ever delay them.
+
+    Lookups binary search the anchors (cached as numpy arrays, converted again only after anchors are added)
+    and interpolate between the two around the query, so mapping any number of wall-clock times to sample
+    indices costs O(log n) each, and sample loss or drift costs at most one anchor interval of error however
+    long the session. Outside the recorded range the fit is used.
+
+    Parameters
+    ----------
+    nominal_rate: float
+        Sampling rate the board reports (BoardShim.get_sampling_rate)
+    spacing: float
+        Minimum seconds between anchors
+    """
+    def __init__(self, nominal_rate, spacing=1.0):
+        self.nominal_rate = nominal_rate
+        self.spacing = spacing
+        self.origin = None  # Host time session-relative annotation times count from (set when collection starts)
+        self.t0 = None  # First timestamp, subtracted so the sums keep their precision
+        self.sums = np.zeros(5)  # n, sum x, sum y, sum xy, sum xx over (sample index, timestamp - t0)
+        self.indices, self.times = [], []
+        self.cache = (np.empty(0), np.empty(0))  # float64 arrays of indices and times for lookups
+        self.latest = None  # Newest (index, time) point, kept as the final anchor when saving
+        self.saved_fit = None  # (rate, start) of a model loaded from disk
+
+    def update(self, first, timestamps):
+        """Add the timestamps of a chunk whose first sample has session index `first`"""
+        n = len(timestamps)
+        if not n:
+            return
+        if self.t0 is None:
+            self.t0 = float(timestamps[0])
+        x = np.arange(first, first + n, dtype=np.float64)
+        y = np.asarray(timestamps, dtype=np.float64) - self.t0
+        self.sums += (n, x.sum(), y.sum(), x @ y, x @ x)
+        rate, _ = self.fit()
+        last = first + n - 1
+        anchor = self.t0 + float((y - x / rate).min()) + last / rate
+        self.latest = (last, anchor)
+        if not self.times or anchor - self.times[-1] >= self.spacing:
+            self.indices.append(last)
+            self.times.append(anchor)
+
+    def fit(self):
+        """(effective rate in Hz, host time of sample 0) from the least-squares fit"""
+        if self.saved_fit:
+            return self.saved_fit
+        n, sx, sy, sxy, sxx = self.sums
+        det = n * sxx - sx * sx
+        if n < 2 or det <= 0 or (slope := (n * sxy - sx * sy) / det) <= 0:
+            return float(self.nominal_rate), (self.t0 or 0.0)
+        return 1 / slope, (self.t0 or 0.0) + (sy - slope * sx) / n
+
+    def anchors(self):
+        """(indices, times) as float64 arrays, converted again only when anchors were added since the last call"""
+        indices, times = self.cache
+        if len(indices) != min(len(self.indices), len(self.times)):
+            n = min(len(self.indices), len(self.times))  # The collection thread may be appending an anchor
+            self.cache = indices, times = (np.array(self.indices[:n], dtype=np.float64),
+                                           np.array(self.times[:n], dtype=np.float64))
+        return indices, times
+
+    def index(self, times):
+        """Fractional session sample index at host time(s)"""
+        times = np.asarray(times, dtype=np.float64)
+        rate, start = self.fit()
+        fitted = (times - start) * rate
+        indices, anchor_times = self.anchors()
+        if len(anchor_times) < 2:
+            return fitted
+        inside = (times >= anchor_times[0]) & (times <= anchor_times[-1])
+        return np.where(inside, np.interp(times, anchor_times, indices), fitted)
+
+    def time(self, indices):
+        """Host time at session sample index(es)"""
+        indices = np.asarray(indices, dtype=np.float64)
+        rate, start = self.fit()
+        fitted = start + indices / rate
+        anchor_indices, times = self.anchors()
+        if len(anchor_indices) < 2:
+            return fitted
+        inside = (indices >= anchor_indices[0]) & (indices <= anchor_indices[-1])
+        return np.where(inside, np.interp(indices, anchor_indices, times), fitted)
+
+    def relative_index(self, seconds):
+        """Sample index of times given in seconds since the origin, e.g. info.json annotations"""
+        if self.origin is None:
+            raise ValueError("Clock model has no origin.")
+        return self.index(self.origin + np.asarray(seconds, dtype=np.float64))
+
+    def summary(self):
+        rate, start = self.fit()
+        return {"NominalRate": self.nominal_rate, "EffectiveRate": round(rate, 6),
+                "DriftPPM": round((rate / self.nominal_rate - 1) * 1e6, 1), "Anchors": len(self.indices)}
+
+    def to_dict(self):
+        rate, start = self.fit()
+        anchors = list(zip(self.indices, self.times))
+        if self.latest and self.latest[0] > anchors[-1][0]:
+            anchors.append(self.latest)
+        return dict(self.summary(), Origin=self.origin, Start=start, Spacing=self.spacing,
+                    Anchors=[[i, round(t, 6)] for i, t in anchors])
+
+    def save(self, sespath):
+        with open(os.path.join(sespath, CLOCK_NAME), 'w') as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, sespath):
+        """Model saved with a session, ready for lookups"""
+        with open(os.path.join(sespath, CLOCK_NAME)) as f:
+            saved = json.load(f)
+        model = cls(saved['NominalRate'], saved['Spacing'])
+        model.origin = saved['Origin']
+        model.indices = [i for i, t in saved['Anchors']]
+        model.times = [t for i, t in saved['Anchors']]
+        model.saved_fit = (saved['EffectiveRate'], saved['Start'])
+        return model
+
+
+def annotation_samples(sespath):
+    """info.json annotations as (sample index, note) pairs, mapped through the session's clock model"""
+    with open(os.path.join(sespath, "info.json")) as f:
+        annotations = json.load(f).get('Annotations', [])
+    if not annotations:
+        return []
+    indices = ClockModel.load(sespath).relative_index([t for t, note in annotations])
+    return [(int(round(i)), note) for i, (t, note) in zip(indices, annotations)]
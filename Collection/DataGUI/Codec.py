@@ -0,0 +1,141 @@
+"""Lossless compression of session chunks"""
+from brainflow.board_shim import BoardShim
+
+import bz2
+import lzma
+import numpy as np
+import os
+import struct
+import zlib
+
+MAGIC = b"NDZ1"
+FRAME = struct.Struct("<4sIIBBI")  # magic, rows, samples, itemsize, coder id, payload length
+ROW = struct.Struct("<Bd")  # row mode, scale
+RAW, QUANTIZED = 0, 1  # Row modes: delta of the float bit patterns, or delta of integer ADC counts
+
+CODERS = {  # id: (name, compress, decompress)
+    1: ("zlib", lambda b, level: zlib.compress(b, level), zlib.decompress),
+    2: ("bz2", lambda b, level: bz2.compress(b, level), bz2.decompress),
+    3: ("lzma", lambda b, level: lzma.compress(b, preset=level), lzma.decompress),
+}
+CODER_IDS = {name: cid for cid, (name, _, _) in CODERS.items()}
+INT_VIEWS = {4: np.int32, 8: np.int64}
+
+
+def board_scales(board_id, rows):
+    """
+    Per-row candidate scales for a BrainFlow board: the ADC count scale of Cyton EEG and accelerometer rows
+    (default gain 24) and 1.0 elsewhere. Candidates are only used where they reproduce a row exactly.
+    """
+    scales = np.ones(rows)
+    try:
+        scales[BoardShim.get_eeg_channels(board_id)] = 4.5 / 24 / (2 ** 23 - 1) * 1e6
+        scales[BoardShim.get_accel_channels(board_id)] = 0.002 / 2 ** 4
+    except Exception:  # Boards without these row groups just keep the generic scale
+        pass
+    return scales
+
+
+def quantize(row, scale):
+    """Integer counts that reproduce row bit-for-bit when multiplied by scale, or None"""
+    with np.errstate(all='ignore'):
+        q = np.rint(row / scale)
+        if not np.all(np.isfinite(q)) or np.abs(q).max(initial=0) >= 2 ** (8 * row.itemsize - 2):
+            return None
+        counts = q.astype(INT_VIEWS[row.itemsize])
+        restored = counts.astype(row.dtype) * row.dtype.type(scale)
+    return counts if np.array_equal(restored.view(counts.dtype), row.view(counts.dtype)) else None
+
+
+def encode(chunk, scales=None, coder="zlib", level=6):
+    """
+    Encode a (rows, n) float chunk as one self-contained frame. Each channel is delta encoded over time, either on
+    its integer ADC counts (when a candidate scale reproduces it exactly) or on the integer view of its floats,
+    which is always exact with wrapping arithmetic. Bytes of equal significance are then grouped together and the
+    result is entropy coded with a stdlib coder.
+
+    Parameters
+    ----------
+    chunk: np.ndarray
+        (rows, n) float32 or float64 samples
+    scales: sequence
+        Optional candidate scale per row (see board_scales)
+    coder: str
+        "zlib" (fast), "bz2" or "lzma" (smaller, slower)
+    level: int
+        Compression level passed to the coder
+    """
+    chunk = np.ascontiguousarray(chunk)
+    rows, n = chunk.shape
+    itemsize = chunk.dtype.itemsize
+    ints = chunk.view(INT_VIEWS[itemsize]).copy()
+    table = b""
+    for r in range(rows):
+        scale = scales[r] if scales is not None else 1.0
+        if n and (counts := quantize(chunk[r], scale)) is not None:
+            ints[r] = counts
+            table += ROW.pack(QUANTIZED, scale)
+        else:
+            table += ROW.pack(RAW, 0.0)
+    deltas = np.empty_like(ints)
+    if n:
+        deltas[:, 0] = ints[:, 0]
+        np.subtract(ints[:, 1:], ints[:, :-1], out=deltas[:, 1:])
+    shuffled = deltas.astype(deltas.dtype.newbyteorder('<')).view(np.uint8).reshape(-1, itemsize).T.tobytes()
+    cid = CODER_IDS[coder]
+    payload = CODERS[cid][1](table + shuffled, level)
+    return FRAME.pack(MAGIC, rows, n, itemsize, cid, len(payload)) + payload
+
+
+def decode_payload(rows, n, itemsize, cid, payload):
+    raw = CODERS[cid][2](payload)
+    modes = [ROW.unpack_from(raw, r * ROW.size) for r in range(rows)]
+    shuffled = np.frombuffer(raw, dtype=np.uint8, offset=rows * ROW.size)
+    deltas = shuffled.reshape(itemsize, -1).T.copy().view(np.dtype(INT_VIEWS[itemsize]).newbyteorder('<'))
+    ints = np.cumsum(deltas.reshape(rows, n), axis=1, dtype=INT_VIEWS[itemsize])
+    dtype = np.dtype(np.float32 if itemsize == 4 else np.float64)
+    out = ints.view(dtype)
+    for r, (mode, scale) in enumerate(modes):
+        if mode == QUANTIZED:
+            out[r] = ints[r].astype(dtype) * dtype.type(scale)
+    return out
+
+
+def decode(frame: bytes):
+    """Decode one frame produced by encode"""
+    magic, rows, n, itemsize, cid, length = FRAME.unpack_from(frame)
+    if magic != MAGIC:
+        raise ValueError("Not a compressed session frame.")
+    return decode_payload(rows, n, itemsize, cid, frame[FRAME.size:FRAME.size + length])
+
+
+def iter_frames(f, start=0, stop=None):
+    """
+    Streaming decoder: yield decoded (rows, n) chunks from a file object until EOF or a torn frame. With start or
+    stop, only samples [start, stop) are yielded: frames before start are skipped without reading their payload,
+    reading ends at the frame holding stop - 1, and the frames at either end are trimmed.
+    """
+    index = 0
+    while (stop is None or index < stop) and len(head := f.read(FRAME.size)) == FRAME.size:
+        magic, rows, n, itemsize, cid, length = FRAME.unpack(head)
+        if magic != MAGIC:
+            raise ValueError("Corrupt compressed session frame.")
+        if index + n <= start:
+            f.seek(length, os.SEEK_CUR)
+            index += n
+            continue
+        payload = f.read(length)
+        if len(payload) != length:
+            return
+        chunk = decode_payload(rows, n, itemsize, cid, payload)
+        if start > index or (stop is not None and stop < index + n):
+            chunk = chunk[:, max(0, start - index):None if stop is None else stop - index]
+        index += n
+        yield chunk
+
+
+def read_file(path, rows):
+    """Decode a whole compressed data file into one (rows, samples) array"""
+    with open(path, 'rb') as f:
+        chunks = list(iter_frames(f))
+    return np.hstack(chunks) if chunks else np.empty((rows, 0))
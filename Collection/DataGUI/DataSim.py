@@ -1,36 +1,158 @@
+"""Simulated board data for boardless testing"""
+from brainflow.board_shim import BoardShim
+from collections import deque
+from threading import Thread, Event
+from time import time
+
 import numpy as np
-from time import sleep
-from threading import Thread
 
 
-# Simulated data generator for GUI testing
+def pink_noise(channels, n, rng):
+    """(channels, n) unit-variance 1/f noise, shaped in the frequency domain"""
+    spectrum = rng.standard_normal((channels, n // 2 + 1)) + 1j * rng.standard_normal((channels, n // 2 + 1))
+    scale = np.ones(n // 2 + 1)
+    scale[1:] = 1 / np.sqrt(np.arange(1, n // 2 + 1))
+    scale[0] = 0  # No DC offset
+    noise = np.fft.irfft(spectrum * scale, n)
+    return noise / noise.std(axis=1, keepdims=True)
+
+
+def erp_wave(t):
+    """Stereotyped ERP (N100 and P300) in microvolts at times t seconds after stimulus onset"""
+    return -3 * np.exp(-((t - 0.1) / 0.03) ** 2) + 6 * np.exp(-((t - 0.3) / 0.06) ** 2)
+
+
 class DataSim:
-    def __init__(self, rows):
-        self.buffer = np.zeros((rows, 1))
-        self.rows = rows
-        self.count = 1
-        self.active = False
-        self.logger = None
-
-    def start_stream(self):
-        self.active = True
-        gen = Thread(target=self.generate_data)
-        gen.start()
+    """
+    Stands in for a BrainFlow board: generates correctly shaped samples at the board's sampling rate in
+    vectorized blocks on a background thread. Blocks are handed to get_data through a deque, whose append and
+    popleft are atomic, so the generator and the collection thread never share a buffer.
+
+    EEG rows hold pink noise plus, during active StimCycle blocks, an SSVEP sinusoid at one of the GridFlash
+    frequencies (the attended frequency rotates block by block) and an ERP after every RandomPrompt time.
+    The package counter and timestamp rows behave like a real board, so GapDetector works unchanged.
+
+    Parameters
+    ----------
+    board_id: int
+        BrainFlow board id whose row layout and sampling rate are simulated
+    noise_uv: float
+        RMS of the background EEG in microvolts
+    ssvep_uv: float
+        Amplitude of the SSVEP sinusoid in microvolts
+    interval: float
+        Seconds between generated blocks
+    loss: float
+        Fraction of samples dropped at random, to exercise sample-loss detection
+    seed: int
+        Random seed, None for a different session every run
+    """
+    table_seconds = 64  # Length of the precomputed pink noise table each channel loops over
+
+    def __init__(self, board_id, noise_uv=10.0, ssvep_uv=2.0, interval=0.05, loss=0.0, seed=None):
+        self.rows = BoardShim.get_num_rows(board_id)
+        self.srate = BoardShim.get_sampling_rate(board_id)
+        self.eeg = BoardShim.get_eeg_channels(board_id)
+        self.pkg_row = BoardShim.get_package_num_channel(board_id)
+        self.ts_row = BoardShim.get_timestamp_channel(board_id)
+        self.marker_row = BoardShim.get_marker_channel(board_id)
+        self.noise_uv = noise_uv
+        self.ssvep_uv = ssvep_uv
+        self.interval = interval
+        self.loss = loss
+        self.rng = np.random.default_rng(seed)
+        self.table = pink_noise(len(self.eeg), int(self.table_seconds * self.srate), self.rng) * noise_uv
+        self.offsets = self.rng.integers(0, self.table.shape[1], len(self.eeg))[:, np.newaxis]
+        self.frequencies, self.erp_times = (), np.empty(0)
+        self.stimcycle, self.blength = "", 0
+        self.blocks = deque()
+        self.markers = deque()  # (value, time inserted) for the marker row of upcoming samples
+        self.produced = 0  # Samples generated (only written by the generator thread)
+        self.consumed = 0  # Samples handed out (only written by the reading thread)
+        self.buffsize = None
+        self.stopped = Event()
+        self.thread = None
+        self.start_time = None
+
+    def configure(self, stimcycle="", blength=0, stim=None):
+        """Follow a session's stimulus: SSVEP frequencies of a GridFlash and prompt times of a RandomPrompt"""
+        self.stimcycle, self.blength = stimcycle, blength
+        self.frequencies = tuple(getattr(stim, 'frequencies', ()))
+        self.erp_times = np.asarray(getattr(stim, 'times', ()), dtype=float)
+
+    def attended(self, block):
+        """SSVEP frequency simulated during a block, or None for rest blocks"""
+        if not self.frequencies or block >= len(self.stimcycle) or self.stimcycle[block] != '1':
+            return None
+        return self.frequencies[self.stimcycle[:block].count('1') % len(self.frequencies)]
+
+    def generate(self, start, n):
+        """Samples [start, start + n) of the session as a (rows, n) array"""
+        index = np.arange(start, start + n)
+        t = index / self.srate
+        data = np.zeros((self.rows, n))
+        if not n:
+            return data
+        data[self.eeg] = np.take_along_axis(self.table, (index + self.offsets) % self.table.shape[1], axis=1)
+        if self.blength:
+            blocks = (t // self.blength).astype(int)
+            for block in np.unique(blocks):
+                if (freq := self.attended(block)) is not None:
+                    mask = blocks == block
+                    data[np.ix_(self.eeg, mask)] += self.ssvep_uv * np.sin(2 * np.pi * freq * t[mask])
+        for onset in self.erp_times[(self.erp_times > t[0] - 1) & (self.erp_times <= t[-1])]:
+            data[self.eeg] += erp_wave(t - onset) * (t >= onset)
+        data[self.pkg_row] = index % 256
+        data[self.ts_row] = (self.start_time or 0) + t
+        return data
+
+    def record(self, seconds):
+        """Generate a whole session offline, without the streaming thread"""
+        return self.generate(0, int(seconds * self.srate))
+
+    def start_stream(self, buffsize=450000):
+        self.buffsize = buffsize
+        self.blocks.clear()
+        self.produced = self.consumed = 0
+        self.start_time = time()
+        self.stopped.clear()
+        self.thread = Thread(target=self.generate_data, name="DataSim", daemon=True)
+        self.thread.start()
 
     def stop_stream(self):
-        self.active = False
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
 
     def generate_data(self):
-        while self.active:
-            sleep(.25)
-            new_col = np.ones((self.rows, 1)) * self.count
-            if not self.buffer.any():
-                self.buffer = new_col
-            else:
-                self.buffer = np.hstack((self.buffer, new_col))
-            self.count += 1
+        generated = 0
+        while not self.stopped.wait(self.interval):
+            due = int((time() - self.start_time) * self.srate)
+            if due <= generated:
+                continue
+            block = self.generate(generated, due - generated)
+            if self.loss:
+                block = block[:, self.rng.random(block.shape[1]) >= self.loss]
+            # On the first sample generated for the time of insertion (later markers wait for the next block)
+            while self.markers and block.shape[1] and self.markers[0][1] <= block[self.ts_row, -1]:
+                value, inserted = self.markers.popleft()
+                block[self.marker_row, np.searchsorted(block[self.ts_row], inserted)] = value
+            generated = due
+            self.blocks.append(block)
+            self.produced += block.shape[1]
+
+    def insert_marker(self, value):
+        """Put value in the marker row of the sample due now, like BoardShim.insert_marker"""
+        self.markers.append((value, time()))
+
+    def get_data_count(self):
+        return min(self.produced - self.consumed, self.buffsize or self.produced)
 
     def get_data(self):
-        copy = np.copy(self.buffer)
-        self.buffer = np.zeros((5, 1))
-        return copy
+        """Take every block generated so far, keeping only the newest buffsize samples like the board ring buffer"""
+        taken = []
+        while self.blocks:
+            taken.append(self.blocks.popleft())
+        data = np.hstack(taken) if taken else np.empty((self.rows, 0))
+        self.consumed += data.shape[1]
+        return data[:, -self.buffsize:] if self.buffsize and data.shape[1] > self.buffsize else data
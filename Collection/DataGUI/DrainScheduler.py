@@ -0,0 +1,68 @@
+"""Drain timing for the board ring buffer"""
+from time import monotonic
+
+
+class DrainScheduler:
+    """
+    Decides when the collection thread should drain the board from how full its ring buffer is. A drain is due
+    once the buffer reaches the fill watermark or the oldest undrained sample is max_latency seconds old.
+
+    Parameters
+    ----------
+    buffsize: int
+        Size of the board ring buffer in samples (BufferSize)
+    srate: int
+        Board sampling rate in Hz
+    watermark: float
+        Fraction of buffsize at which to drain
+    max_latency: float
+        Longest time in seconds between drains, bounding how stale data can be for live consumers
+    min_poll: float
+        Shortest time in seconds between polls of get_board_data_count
+    """
+    risk_level = 0.9  # Fill fraction at a drain that is reported as an overflow risk
+
+    def __init__(self, buffsize, srate, watermark=0.5, max_latency=5.0, min_poll=0.02):
+        self.buffsize = buffsize
+        self.srate = srate
+        self.watermark = watermark
+        self.max_latency = max_latency
+        self.min_poll = min_poll
+        self.threshold = max(1, int(buffsize * watermark))
+        self.last_drain = monotonic()
+        self.drains = 0
+        self.samples = 0
+        self.max_fill = 0.0
+        self.max_age = 0.0
+        self.risky = 0
+
+    def reset(self):
+        """Restart the latency clock, e.g. when the stream starts"""
+        self.last_drain = monotonic()
+
+    def wait_time(self, count):
+        """Seconds to wait before polling again, or 0 if the buffer holding `count` samples should be drained now"""
+        since = monotonic() - self.last_drain
+        if count >= self.threshold or since >= self.max_latency:
+            return 0
+        to_watermark = (self.threshold - count) / self.srate
+        return max(self.min_poll, min(to_watermark, self.max_latency - since))
+
+    def drained(self, count):
+        """Record a drain of `count` samples. Returns True if the buffer was close enough to full to risk overflow."""
+        now = monotonic()
+        fill = count / self.buffsize
+        self.max_fill = max(self.max_fill, fill)
+        self.max_age = max(self.max_age, count / self.srate)
+        self.drains += 1
+        self.samples += count
+        self.last_drain = now
+        if fill >= self.risk_level:
+            self.risky += 1
+            return True
+        return False
+
+    def summary(self):
+        mean = self.samples / self.drains if self.drains else 0
+        return (f"{self.drains} drains, mean {mean:.0f} samples/drain, max buffer fill {100 * self.max_fill:.1f}%, "
+                f"max data latency {self.max_age:.2f}s, {self.risky} drains at overflow risk")
@@ -0,0 +1,202 @@
+"""Write-ahead journal for in-progress sessions and recovery of crashed sessions"""
+from SessionWriter import BIN_NAME, HEADER_NAME, export_csv, open_session
+from threading import Lock
+from time import monotonic
+
+import json
+import numpy as np
+import os
+import struct
+import zlib
+
+JOURNAL_NAME = "session.journal"
+MAGIC = b"NDJ1"
+SEGMENT = struct.Struct("<4sBIII")  # magic, kind, sequence number, payload length, payload crc32
+DATA_RECORD = struct.Struct("<QQI")  # data.bin offset, byte count, crc32 of those bytes
+
+HEADER, INFO, DATA, LOG = 1, 2, 3, 4
+
+
+class Journal:
+    """
+    Append-only journal of checksummed segments kept next to data.bin. Data segments index the bytes written
+    to data.bin with their crc32, so durability costs one small record per drain instead of a full rewrite.
+
+    Parameters
+    ----------
+    sespath: str
+        Session directory
+    sync_every: int
+        Number of data segments between fsyncs (0 disables the segment count trigger)
+    sync_interval: float
+        Maximum seconds between fsyncs while segments are pending (0 disables the time trigger)
+    """
+    def __init__(self, sespath, sync_every=1, sync_interval=5.0):
+        self.path = os.path.join(sespath, JOURNAL_NAME)
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.lock = Lock()
+        self.file = None
+        self.closed = False
+        self.seq = 0
+        self.pending = 0  # Data segments written since the last sync
+        self.last_sync = monotonic()
+
+    def append(self, kind, payload: bytes):
+        with self.lock:
+            if self.closed:
+                return
+            if self.file is None:
+                self.file = open(self.path, 'ab')
+            self.file.write(SEGMENT.pack(MAGIC, kind, self.seq, len(payload), zlib.crc32(payload)) + payload)
+            self.seq += 1
+            if kind == DATA:
+                self.pending += 1
+
+    def record_header(self, header):
+        self.append(HEADER, json.dumps(header).encode())
+
+    def record_info(self, infopath):
+        """Snapshot info.json so it can be restored if the file is lost or half written"""
+        if os.path.exists(infopath):
+            with open(infopath, 'rb') as f:
+                self.append(INFO, f.read())
+
+    def record_data(self, offset, payload: bytes):
+        self.append(DATA, DATA_RECORD.pack(offset, len(payload), zlib.crc32(payload)))
+
+    def log(self, message):
+        self.append(LOG, message.encode())
+
+    def due(self):
+        """True once the configured fsync cadence has been reached"""
+        if not self.pending:
+            return False
+        if self.sync_every and self.pending >= self.sync_every:
+            return True
+        return bool(self.sync_interval) and monotonic() - self.last_sync >= self.sync_interval
+
+    def sync(self):
+        """Force journal segments to disk. Data must be synced first so the index never outruns it."""
+        with self.lock:
+            if self.file is None or self.file.closed:
+                return
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.pending = 0
+            self.last_sync = monotonic()
+
+    def close(self):
+        self.sync()
+        with self.lock:
+            self.closed = True
+            if self.file is not None:
+                self.file.close()
+
+
+def read_segments(path):
+    """Yield (kind, seq, payload) for every intact segment, stopping at the first torn or corrupt one"""
+    with open(path, 'rb') as f:
+        while len(head := f.read(SEGMENT.size)) == SEGMENT.size:
+            magic, kind, seq, length, crc = SEGMENT.unpack(head)
+            if magic != MAGIC:
+                return
+            payload = f.read(length)
+            if len(payload) != length or zlib.crc32(payload) != crc:
+                return
+            yield kind, seq, payload
+
+
+def valid_json(path):
+    try:
+        with open(path) as f:
+            json.load(f)
+        return True
+    except (OSError, ValueError):
+        return False
+
+
+def recover(sespath, outpath=None):
+    """
+    Rebuild a valid session directory (data.bin, data.json, data.csv, info.json, sessionlog.log) from the journal
+
+    Parameters
+    ----------
+    sespath: str
+        Directory of the interrupted session
+    outpath: str
+        Directory for the recovered session (defaults to repairing sespath in place)
+
+    Returns
+    -------
+    dict summarizing what was recovered
+    """
+    outpath = outpath or sespath
+    os.makedirs(outpath, exist_ok=True)
+    header, info, logs, records = None, None, [], []
+    for kind, _, payload in read_segments(os.path.join(sespath, JOURNAL_NAME)):
+        if kind == HEADER:
+            header = json.loads(payload)
+        elif kind == INFO:
+            info = payload
+        elif kind == LOG:
+            logs.append(payload.decode(errors='replace'))
+        elif kind == DATA:
+            records.append(DATA_RECORD.unpack(payload))
+    if header is None:
+        raise ValueError("Journal has no data header. Nothing to recover.")
+
+    # Keep the longest prefix of data.bin whose segments match their checksums
+    binpath = os.path.join(sespath, BIN_NAME)
+    valid_end, good = 0, 0
+    with open(binpath, 'rb') as f:
+        for offset, length, crc in records:
+            f.seek(offset)
+            if offset != valid_end or zlib.crc32(f.read(length)) != crc:
+                break
+            valid_end = offset + length
+            good += 1
+
+    outbin = os.path.join(outpath, BIN_NAME)
+    if os.path.abspath(outpath) == os.path.abspath(sespath):
+        with open(binpath, 'r+b') as f:
+            f.truncate(valid_end)
+    else:
+        with open(binpath, 'rb') as src, open(outbin, 'wb') as dst:
+            remaining = valid_end
+            while remaining and (block := src.read(min(remaining, 1 << 20))):
+                dst.write(block)
+                remaining -= len(block)
+
+    header['Samples'] = valid_end // (np.dtype(header['DataType']).itemsize * header['Rows'])
+    with open(os.path.join(outpath, HEADER_NAME), 'w') as f:
+        json.dump(header, f, indent=4)
+    if header.get('Codec'):  # Compressed frames have no fixed size per sample
+        header['Samples'] = open_session(outpath)[1].shape[1]
+        with open(os.path.join(outpath, HEADER_NAME), 'w') as f:
+            json.dump(header, f, indent=4)
+
+    infopath = os.path.join(outpath, "info.json")
+    if info is not None and not valid_json(infopath):
+        with open(infopath, 'wb') as f:
+            f.write(info)
+    logpath = os.path.join(outpath, "sessionlog.log")
+    if logs and not os.path.exists(logpath):
+        with open(logpath, 'w') as f:
+            f.write("\n".join(logs) + "\n")
+
+    export_csv(outpath)
+    return {"Samples": header['Samples'], "Segments": good, "DiscardedSegments": len(records) - good,
+            "Info": info is not None, "LogLines": len(logs)}
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(prog='Journal.py',
+                                     description='Recovers an interrupted session from its session.journal')
+    parser.add_argument('session_path', help="Path to the interrupted session directory")
+    parser.add_argument('-o', '--output', help="Directory for the recovered session (default: repair in place)")
+    args = parser.parse_args()
+    summary = recover(os.path.abspath(args.session_path), args.output and os.path.abspath(args.output))
+    print(f"Recovered {summary['Samples']} samples from {summary['Segments']} segments "
+          f"({summary['DiscardedSegments']} discarded), info.json: {summary['Info']}, log lines: {summary['LogLines']}")
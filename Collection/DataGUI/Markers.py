@@ -0,0 +1,105 @@
+"""Sample-accurate event markers"""
+from threading import Lock
+from time import time
+
+import json
+import numpy as np
+import os
+
+MARKERS_NAME = "markers.jsonl"  # One resolved event per line
+
+
+class MarkerTable:
+    """
+    Places events (annotations, block changes, stimulus onsets) on the sample clock. Each event gets a numeric
+    code that is written into the board's marker channel (BoardShim.insert_marker). When a drained chunk
+    contains the code, the event's session sample index is known exactly, and its latency is measured as the
+    sample's board timestamp minus the time the event was requested. Resolved events are appended to
+    markers.jsonl, a sample-indexed side table, so they survive row selection that drops the marker row.
+
+    Events that cannot go through the board (no marker channel, not streaming) are placed at the estimated
+    index of the next sample and flagged "Estimated".
+
+    Parameters
+    ----------
+    sespath: str
+        Session directory
+    marker_row: int
+        Board row of the marker channel, None if the board has none
+    ts_row: int
+        Board row of the timestamp channel
+    """
+    def __init__(self, sespath, marker_row, ts_row):
+        self.path = os.path.join(sespath, MARKERS_NAME)
+        self.marker_row = marker_row
+        self.ts_row = ts_row
+        self.lock = Lock()
+        self.next_code = 1  # Codes stay well below 2**24, so they are exact in float32 storage too
+        self.pending = {}  # code: (label, source, request time)
+        self.latencies = []
+        self.count = 0
+        self.estimated = 0
+
+    def request(self, label, source):
+        """Register an event and return the code to insert into the marker channel"""
+        with self.lock:
+            code = self.next_code
+            self.next_code += 1
+            self.pending[code] = (label, source, time())
+        return code
+
+    def resolve(self, chunk, first):
+        """Find pending codes in a raw board chunk whose first sample has session index `first`"""
+        if not self.pending or self.marker_row is None or not chunk.shape[1]:
+            return
+        for col in np.flatnonzero(chunk[self.marker_row]):
+            with self.lock:
+                event = self.pending.pop(int(round(chunk[self.marker_row, col])), None)
+            if event is None:  # Marker from another source, e.g. the board's own button
+                continue
+            label, source, requested = event
+            latency = float(chunk[self.ts_row, col]) - requested
+            self.latencies.append(latency)
+            self.write(first + int(col), label, source, latency=round(latency * 1000, 3))
+
+    def place(self, code, index):
+        """Record a pending event at an estimated sample index"""
+        with self.lock:
+            event = self.pending.pop(code, None)
+        if event is not None:
+            self.estimated += 1
+            self.write(index, event[0], event[1], estimated=True)
+
+    def flush(self, index):
+        """Place every event still pending (requested after the last drain) at sample `index`"""
+        for code in list(self.pending):
+            self.place(code, index)
+
+    def write(self, index, label, source, latency=None, estimated=False):
+        entry = {"Sample": index, "Label": label, "Source": source}
+        if latency is not None:
+            entry["LatencyMs"] = latency
+        if estimated:
+            entry["Estimated"] = True
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.count += 1
+
+    def summary(self):
+        """Marker count and request-to-sample latency statistics for info.json"""
+        out = {"Count": self.count, "Estimated": self.estimated}
+        if self.latencies:
+            ms = np.array(self.latencies) * 1000
+            out.update({"LatencyMedianMs": round(float(np.median(ms)), 3),
+                        "LatencyP95Ms": round(float(np.percentile(ms, 95)), 3),
+                        "LatencyMaxMs": round(float(ms.max()), 3)})
+        return out
+
+
+def read_markers(sespath):
+    """Resolved events of a session as a list of dicts, in the order they were resolved"""
+    path = os.path.join(sespath, MARKERS_NAME)
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
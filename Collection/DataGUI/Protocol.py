@@ -0,0 +1,146 @@
+"""Trial protocols measured in samples rather than wall-clock seconds"""
+from brainflow import LogLevels, BrainFlowError
+from BoardBridge import CollectionSession
+from bisect import bisect_right
+from collections import namedtuple
+
+import numpy as np
+import os
+
+# start/stop: session sample indices, trial: 0-based trial (None for breaks), offset: first sample within the trial
+Block = namedtuple("Block", ("start", "stop", "trial", "offset", "label"))
+
+
+class Protocol:
+    """
+    Session plan in samples: `trials` repetitions of the StimCycle blocks, each exactly `block_samples` long,
+    with `break_samples` recorded between trials. Block boundaries are indices of recorded samples, so they
+    line up with the data exactly however the board buffer is drained.
+
+    Parameters
+    ----------
+    block_samples: int
+        Samples per block
+    stimcycle: str
+        Stimulus/rest cycle of one trial, e.g. "10101"
+    trials: int
+        Number of trials
+    break_samples: int
+        Samples recorded between trials, kept in data.bin but not in the trial arrays
+    """
+    def __init__(self, block_samples, stimcycle, trials=1, break_samples=0):
+        self.block_samples = int(block_samples)
+        self.stimcycle = stimcycle
+        self.trials = int(trials)
+        self.break_samples = int(break_samples)
+        self.trial_samples = self.block_samples * len(stimcycle)
+        self.blocks = []
+        self.trial_ends = []  # Index of the first sample after each trial
+        index = 0
+        for trial in range(self.trials):
+            if trial and self.break_samples:
+                self.blocks.append(Block(index, index + self.break_samples, None, None, f"Break{trial}"))
+                index += self.break_samples
+            for k in range(len(stimcycle)):
+                self.blocks.append(Block(index, index + self.block_samples, trial, k * self.block_samples,
+                                         f"Trial{trial + 1}Block{k + 1}"))
+                index += self.block_samples
+            self.trial_ends.append(index)
+        self.total = index
+        self.starts = [block.start for block in self.blocks]
+
+    def locate(self, index):
+        """Block containing session sample `index`, None once the protocol is over"""
+        if not 0 <= index < self.total:
+            return None
+        return self.blocks[bisect_right(self.starts, index) - 1]
+
+    def next_boundary(self, index):
+        """Index of the first sample after the block containing `index`"""
+        block = self.locate(index)
+        return block.stop if block else self.total
+
+    def active(self, block):
+        """True for stimulus blocks, False for rest blocks and breaks"""
+        return block.trial is not None and self.stimcycle[block.offset // self.block_samples] == '1'
+
+    def overlapping(self, start, stop):
+        """Blocks holding any of session samples [start, stop)"""
+        first = max(0, bisect_right(self.starts, start) - 1)
+        return [block for block in self.blocks[first:] if block.start < stop and block.stop > start]
+
+    def trials_complete(self, count):
+        """Trials whose last sample is among the first `count` recorded samples"""
+        return bisect_right(self.trial_ends, count)
+
+    def fill_info(self, info, srate):
+        """Describe the whole protocol in info.json, with block boundaries as sample indices"""
+        sp = info['SessionParams']
+        sp['BlockLength'] = f"{self.block_samples / srate:g}"
+        sp['BlockCount'] = str(len(self.stimcycle) * self.trials)
+        sp['StimCycle'] = self.stimcycle * self.trials
+        info['BlockSamples'] = [[block.start, block.label] for block in self.blocks] + [[self.total, "End"]]
+        return info
+
+
+class ProtocolSession(CollectionSession):
+    """
+    CollectionSession that records exactly protocol.total samples and copies them into preallocated per-trial
+    arrays, cutting blocks on sample indices. The wait between drains comes from get_board_data_count, so a drain
+    happens as soon as the next block boundary is in the board buffer. The session stops itself after the last
+    block and saves the completed trials to trials.npy.
+
+    Parameters
+    ----------
+    protocol: Protocol
+        Trials and blocks to record
+    Remaining parameters are those of CollectionSession.
+    """
+    def __init__(self, boardshim, sespath, buffsize, protocol, **kwargs):
+        super().__init__(boardshim, sespath, buffsize, **kwargs)
+        self.protocol = protocol
+        self.trial_data = np.empty((protocol.trials, len(self.rows), protocol.trial_samples), dtype=self.dtype)
+
+    def drain_wait(self):
+        """Seconds until the next block boundary or scheduled drain, whichever comes first"""
+        try:
+            count = self.pending()
+        except BrainFlowError:
+            return 0  # update_data will surface the error
+        due = self.protocol.next_boundary(self.store.count) - self.store.count
+        if count >= due:
+            return 0
+        return min(self.scheduler.wait_time(count), (due - count) / self.store.srate)
+
+    def select(self, chunk):
+        """Drop samples past the end of the protocol before selecting rows"""
+        return super().select(chunk[:, :max(0, self.protocol.total - self.store.count)])
+
+    def save_data(self, chunk):
+        """Copy the chunk into its trials, then write it. Stops the session once the protocol is complete."""
+        if chunk.shape[1]:
+            self.cut(self.store.count - chunk.shape[1], chunk)
+            super().save_data(chunk)
+        if self.store.count >= self.protocol.total and not self.stop_event.is_set():
+            self.log_message(LogLevels.LEVEL_INFO, f"[GUI]: Protocol complete ({self.protocol.total} samples).")
+            self.stop_event.set()
+
+    def cut(self, first, chunk):
+        """Copy session samples [first, first + n) into the trial arrays, logging each block that starts"""
+        stop = first + chunk.shape[1]
+        for block in self.protocol.overlapping(first, stop):
+            if block.start >= first:
+                self.log_message(LogLevels.LEVEL_INFO, f"[GUI]: {block.label} started at sample {block.start}.")
+            if block.trial is None:
+                continue
+            lo, hi = max(block.start, first), min(block.stop, stop)
+            offset = block.offset + lo - block.start
+            self.trial_data[block.trial, :, offset:offset + hi - lo] = chunk[:, lo - first:hi - first]
+
+    def finalize_data(self):
+        """Save the completed trials next to the session data"""
+        complete = self.protocol.trials_complete(self.store.count)
+        if complete:
+            np.save(os.path.join(self.sespath, "trials.npy"), self.trial_data[:complete])
+        self.log_message(LogLevels.LEVEL_INFO, f"[GUI]: {complete} of {self.protocol.trials} trials complete.")
+        super().finalize_data()
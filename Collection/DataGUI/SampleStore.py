@@ -0,0 +1,190 @@
+"""Growable in-memory storage for board samples"""
+from time import sleep
+
+import numpy as np
+
+
+class SampleStore:
+    """
+    Column-major sample buffer with geometric preallocation. Appending a chunk copies only that chunk
+    (amortized), and the whole session is available as a view of the buffer without copying.
+
+    A single writer (the collection thread) appends while any number of reader threads call latest, range or
+    view. Appends are bracketed by a sequence counter (seqlock): readers retry while it is odd or changed,
+    so they always see a buffer and sample count from the same append. Samples below the count are never
+    rewritten in place, so the returned views stay consistent without copying.
+
+    Parameters
+    ----------
+    rows: int
+        Number of rows per sample (BoardShim.get_num_rows)
+    srate: int
+        Board sampling rate in Hz, used to size the first allocation
+    seconds: float
+        Seconds of data to preallocate before the buffer first needs to grow
+    dtype: numpy dtype
+        Storage dtype of the buffer
+    """
+    growth = 2  # Capacity multiplier applied when the buffer is full
+
+    def __init__(self, rows, srate, seconds=300, dtype=np.float64):
+        self.rows = rows
+        self.srate = srate
+        self.dtype = np.dtype(dtype)
+        self.count = 0
+        self.seq = 0  # Odd while an append is in progress
+        self.buffer = np.empty((rows, max(1, int(srate * seconds))), dtype=self.dtype)
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def capacity(self):
+        return self.buffer.shape[1]
+
+    def append(self, chunk):
+        """Copy a (rows, n) chunk from get_board_data() onto the end of the store"""
+        n = chunk.shape[1]
+        if not n:
+            return
+        if chunk.shape[0] != self.rows:
+            raise ValueError(f"Chunk has {chunk.shape[0]} rows, store expects {self.rows}.")
+        self.seq += 1
+        end = self.count + n
+        if end > self.capacity:
+            self.grow(end)
+        self.buffer[:, self.count:end] = chunk
+        self.count = end
+        self.seq += 1
+
+    def grow(self, needed):
+        """Reallocate to at least `needed` columns, multiplying capacity so growth stays amortized"""
+        capacity = max(needed, int(self.capacity * self.growth))
+        new = np.empty((self.rows, capacity), dtype=self.dtype)
+        new[:, :self.count] = self.buffer[:, :self.count]
+        self.buffer = new  # Views of the old buffer stay valid, they just stop seeing new samples
+
+    def snapshot(self):
+        """(buffer, count) from one completed append, retrying while the writer is mid-append"""
+        while True:
+            seq = self.seq
+            if not seq % 2:
+                buffer, count = self.buffer, self.count
+                if self.seq == seq:
+                    return buffer, count
+            sleep(0)  # Let the writer finish
+
+    def view(self):
+        """Return a no-copy view of every sample stored so far"""
+        buffer, count = self.snapshot()
+        return buffer[:, :count]
+
+    @property
+    def start(self):
+        """Session index of the oldest sample held in memory"""
+        return 0
+
+    def latest(self, n):
+        """No-copy view of the newest n samples (fewer if the store holds less), oldest first"""
+        buffer, count = self.snapshot()
+        return buffer[:, max(0, count - n):count]
+
+    def range(self, start, stop):
+        """
+        No-copy view of session samples [start, stop), clipped to the samples held
+
+        Returns
+        -------
+        (first, view): session index of the first returned sample and the (rows, n) view
+        """
+        buffer, count = self.snapshot()
+        start, stop = max(start, 0), min(stop, count)
+        return start, buffer[:, start:max(start, stop)]
+
+    def holds(self, index):
+        """True while session sample `index` is still held, i.e. views starting at or after it are still valid"""
+        return index >= self.start
+
+    def clear(self):
+        self.seq += 1
+        self.count = 0
+        self.seq += 1
+
+
+class TailStore(SampleStore):
+    """
+    Fixed-size ring holding only the most recent samples, for sessions whose older samples live on disk
+    (data.bin). Memory use is set once at construction and never grows. Every sample is written twice,
+    at its ring position and one ring length later, so any window of recent samples is one contiguous
+    view. A view of k samples stays valid only while at most length - k more samples are appended, so a
+    view of the full tail is overwritten by the next append. holds(first) is True exactly as long as a view
+    whose first sample is `first` is intact; copy views that must outlive that.
+
+    Parameters
+    ----------
+    rows: int
+        Number of rows per sample
+    srate: int
+        Board sampling rate in Hz
+    seconds: float
+        Seconds of the most recent data kept in memory
+    dtype: numpy dtype
+        Storage dtype of the buffer
+    """
+    def __init__(self, rows, srate, seconds=60, dtype=np.float64):
+        super().__init__(rows, srate, 0, dtype)
+        self.length = max(1, int(srate * seconds))
+        self.buffer = np.empty((rows, 2 * self.length), dtype=self.dtype)
+
+    def __len__(self):
+        return min(self.count, self.length)
+
+    @property
+    def capacity(self):
+        return self.length
+
+    @property
+    def start(self):
+        """Session index of the oldest sample still in memory"""
+        return self.count - len(self)
+
+    def append(self, chunk):
+        """Copy a (rows, n) chunk into the ring, overwriting the oldest samples once it is full"""
+        n = chunk.shape[1]
+        if not n:
+            return
+        if chunk.shape[0] != self.rows:
+            raise ValueError(f"Chunk has {chunk.shape[0]} rows, store expects {self.rows}.")
+        if n > self.length:  # Only the newest samples survive
+            chunk = chunk[:, n - self.length:]
+        self.seq += 1
+        pos = (self.count + n - chunk.shape[1]) % self.length
+        for begin in (pos, pos + self.length):
+            first = min(chunk.shape[1], 2 * self.length - begin)
+            self.buffer[:, begin:begin + first] = chunk[:, :first]
+            self.buffer[:, :chunk.shape[1] - first] = chunk[:, first:]  # Second copy wraps to the front
+        self.count += n
+        self.seq += 1
+
+    def grow(self, needed):
+        raise RuntimeError("TailStore has a fixed capacity.")
+
+    def window(self, buffer, start, stop):
+        """View of session samples [start, stop) in the ring, which must hold them"""
+        end = stop % self.length + self.length
+        return buffer[:, end - (stop - start):end]
+
+    def view(self):
+        """No-copy view of every sample held in memory, oldest first"""
+        buffer, count = self.snapshot()
+        return self.window(buffer, count - min(count, self.length), count)
+
+    def latest(self, n):
+        buffer, count = self.snapshot()
+        return self.window(buffer, count - min(n, count, self.length), count)
+
+    def range(self, start, stop):
+        buffer, count = self.snapshot()
+        stop = min(stop, count)
+        start = min(max(start, count - self.length, 0), max(stop, 0))
+        return start, self.window(buffer, start, max(start, stop))
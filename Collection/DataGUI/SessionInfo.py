@@ -0,0 +1,182 @@
+"""Session info (info.json) fields, validation and session directory creation, shared by the GUI and the CLI"""
+from datetime import datetime
+
+import json
+import os
+
+ANNOTATIONS_NAME = "annotations.jsonl"  # Annotations made during collection, one [time, note] per line
+
+BOARDMAP = {'Cyton': (0, 250),  # Headset model: (BrainFlow board id, sampling rate)
+            'CytonDaisy': (2, 125)}
+BUFFSIZE_DEFAULT = 100000
+BUFFSIZE_MAX = 450000
+BUFFSIZE_MIN = 3000
+BLENGTH_MAX = 3600
+BCOUNT_MAX = 360
+
+
+def create_empty_info():
+    return {
+        "SessionParams": {
+            "SubjectName": "",
+            "ProjectName": "",
+            "ResponseType": "",
+            "StimulusType": "",
+            "BlockLength": "",
+            "BlockCount": "",
+            "StimCycle": ""
+        },
+        "HardwareParams": {
+            "SampleRate": "",
+            "HeadsetConfiguration": "",
+            "HeadsetModel": "",
+            "BufferSize": "100000",
+            "RowGroups": "All",
+            "DataType": "float64"
+        },
+        "Description": "",
+        "Annotations": [],
+        "Date": datetime.now().strftime("%m-%d-%y"),
+        "Time": datetime.now().strftime("%H:%M"),
+        "FileID": ""
+        }
+
+
+def check_fields(directory, subject, project, blength, bcount, stimcycle, description, buffsize, serialport):
+    """Validate session fields given as strings. Returns (valid, error message)."""
+    if not directory.strip():
+        return False, "No session directory supplied."
+    if not os.path.isdir(directory.strip()):
+        return False, "Session directory does not exist."
+    if {"data.csv", "data.bin"} & set(os.listdir(directory.strip())):
+        return False, "Data file already in target directory."
+    if "info.json" in os.listdir(directory.strip()):
+        return False, "Info JSON already in target directory."
+    if not subject.strip():
+        return False, "No subject name supplied."
+    if not project.strip():
+        return False, "No project name supplied."
+    bl = blength.strip()
+    if not bl:
+        return False, "No block length supplied."
+    if not bl.lstrip("-").isdigit():
+        return False, "Block length must be a whole number."
+    bl = int(bl)
+    if bl < 1:
+        return False, "Block length must be positive."
+    if bl > BLENGTH_MAX:
+        return False, f"Block length too high. (Max: {BLENGTH_MAX})"
+    bc = bcount.strip()
+    if not bc:
+        return False, "No block count supplied."
+    if not bc.lstrip("-").isdigit():
+        return False, "Block count must be a whole number."
+    bc = int(bc)
+    if bc < 1:
+        return False, "Block count must be positive."
+    elif bc > BCOUNT_MAX:
+        return False, f"Block count too high. (Max: {BCOUNT_MAX})"
+
+    if not stimcycle.strip():
+        return False, "No stimulus cycle supplied."
+    stimcycle = stimcycle.strip()
+    test = stimcycle.replace("1", "").replace("0", "")
+    if len(test):
+        return False, "Invalid characters in stim cycle."
+    if len(stimcycle) != bc:
+        return False, "Stim cycle does not match block count."
+    if not description.strip(" "):
+        return False, "No session description supplied."
+    if not buffsize.strip():
+        return False, "No buffer size supplied."
+    if not buffsize.strip().isdigit():
+        return False, "Buffer size must be a whole number."
+    if int(buffsize) > BUFFSIZE_MAX:
+        return False, f"Buffer size too high. (Max: {BUFFSIZE_MAX})"
+    if int(buffsize) < BUFFSIZE_MIN:
+        return False, f"Buffer size too low. (Min: {BUFFSIZE_MIN})"
+    if not serialport.strip():
+        return False, "No serial port supplied."
+    return True, ""
+
+
+def fill_info(info, subject, project, rtype, stype, blength, bcount, stimcycle, config, model, buffsize,
+              description, rowgroups=None, dtype="float64", annotate_blocks=True, srate=None):
+    """
+    Write validated fields into an info dict and (with annotate_blocks) add one annotation per block. srate
+    overrides the model's sampling rate, e.g. when recording from the synthetic board.
+    """
+    info['SessionParams']['SubjectName'] = subject.strip()
+    info['SessionParams']['ProjectName'] = project.strip()
+    info['SessionParams']['ResponseType'] = rtype
+    info['SessionParams']['StimulusType'] = stype
+    info['SessionParams']['BlockLength'] = str(blength)
+    info['SessionParams']['BlockCount'] = str(bcount)
+    info['SessionParams']['StimCycle'] = stimcycle.strip()
+    info['HardwareParams']['HeadsetConfiguration'] = config
+    info['HardwareParams']['HeadsetModel'] = model
+    info['HardwareParams']['SampleRate'] = str(srate or BOARDMAP[model][1])
+    info['HardwareParams']['BufferSize'] = str(buffsize)
+    info['HardwareParams']['RowGroups'] = ", ".join(rowgroups) if rowgroups else "All"
+    info['HardwareParams']['DataType'] = dtype
+    info['Description'] = description.strip()
+
+    if not annotate_blocks:  # Block boundaries are recorded elsewhere, e.g. as sample indices by Protocol
+        return info
+    bcount = int(bcount)
+    blength = int(blength)
+    info['Annotations'] += [(float(blength*k), f"Block{k}") for k in range(1, bcount+1)]
+    return info
+
+
+def create_session(directory, info):
+    """Create a new session directory under `directory`, write info.json into it and return its path"""
+    suffix = info['Date'] + "_" + str(datetime.now().timestamp()).split(".")[1]
+    sespath = os.path.join(directory, f"session_{suffix}")
+    os.makedirs(sespath, exist_ok=True, mode=0o777)
+    with open(os.path.join(sespath, "info.json"), 'w') as f:
+        json.dump(info, f, ensure_ascii=False, indent=4)
+    return sespath
+
+
+def append_annotation(sespath, time, note):
+    """Append one annotation to the session's annotation journal. Costs the same however many exist."""
+    with open(os.path.join(sespath, ANNOTATIONS_NAME), 'a', encoding='utf-8') as f:
+        f.write(json.dumps([time, note], ensure_ascii=False) + "\n")
+
+
+def read_annotations(sespath):
+    """Annotations in the session's journal, skipping a line torn by a crash"""
+    path = os.path.join(sespath, ANNOTATIONS_NAME)
+    if not os.path.exists(path):
+        return []
+    annotations = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                annotations.append(json.loads(line))
+            except ValueError:
+                continue
+    return annotations
+
+
+def finalize_info(sespath, hardware=None, **fields):
+    """
+    Merge the annotation journal into info.json's Annotations, add `hardware` to HardwareParams and set any extra
+    top-level fields, in a single rewrite of info.json. The journal is removed once merged, so merging again adds nothing. Call it only once
+    nothing can append annotations any more (CollectionSession.annotate is closed first).
+    """
+    ipath = os.path.join(sespath, "info.json")
+    if not os.path.exists(ipath):
+        return None
+    with open(ipath) as f:
+        info = json.load(f)
+    info['Annotations'] = info.get('Annotations', []) + read_annotations(sespath)
+    info.setdefault('HardwareParams', {}).update(hardware or {})
+    info.update(fields)
+    with open(ipath + ".tmp", 'w') as f:
+        json.dump(info, f, ensure_ascii=False, indent=4)
+    os.replace(ipath + ".tmp", ipath)
+    if os.path.exists(jpath := os.path.join(sespath, ANNOTATIONS_NAME)):
+        os.remove(jpath)
+    return info
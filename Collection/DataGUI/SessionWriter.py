@@ -0,0 +1,381 @@
+"""Incremental persistence of session data"""
+from brainflow import BrainFlowError
+from brainflow.board_shim import BoardShim
+from Codec import encode, board_scales, iter_frames, read_file
+from queue import Queue, Full
+from threading import Condition, Thread
+from time import perf_counter
+
+import json
+import numpy as np
+import os
+
+BIN_NAME = "data.bin"
+HEADER_NAME = "data.json"
+FORMAT_VERSION = 1
+
+
+ROW_GROUPS = {  # Row groups selectable at acquisition time and the BoardShim getters that list their rows
+    "EEG": ("get_eeg_channels",),
+    "Accel": ("get_accel_channels",),
+    "Aux": ("get_analog_channels", "get_other_channels"),
+    "Timestamp": ("get_package_num_channel", "get_timestamp_channel"),
+    "Marker": ("get_marker_channel",),
+}
+
+
+def select_rows(board_id, groups=None):
+    """
+    Sorted board rows belonging to the given row groups (see ROW_GROUPS). None selects every row
+    BrainFlow returns. Groups the board does not have are skipped.
+    """
+    if groups is None:
+        return list(range(BoardShim.get_num_rows(board_id)))
+    rows = set()
+    for group in groups:
+        for getter in ROW_GROUPS[group]:
+            try:
+                found = getattr(BoardShim, getter)(board_id)
+            except BrainFlowError:  # Board has no such row
+                continue
+            rows.update(found if isinstance(found, list) else [found])
+    return sorted(rows)
+
+
+def board_header(board_id, srate, rows, dtype=np.float64, groups=None):
+    """Build the binary data header from the BoardShim channel map and the stored board rows"""
+    try:
+        channels = BoardShim.get_board_descr(board_id)
+    except Exception:  # Board descriptions are informational only
+        channels = {}
+    return {
+        "Version": FORMAT_VERSION,
+        "BoardID": board_id,
+        "SampleRate": srate,
+        "Rows": len(rows),
+        "RowIndices": list(rows),  # Board row stored at each row of data.bin
+        "RowGroups": list(groups) if groups is not None else list(ROW_GROUPS),
+        "DataType": np.dtype(dtype).newbyteorder('<').str,
+        "Layout": "sample-major",
+        "Channels": channels,
+        "Samples": 0
+    }
+
+
+def read_header(sespath):
+    with open(os.path.join(sespath, HEADER_NAME)) as f:
+        return json.load(f)
+
+
+def timestamp_index(header):
+    """Row of data.bin holding timestamps relative to TimestampOrigin (float32 sessions), None otherwise"""
+    if header.get('TimestampOrigin') is None:
+        return None
+    ts_row = BoardShim.get_timestamp_channel(header['BoardID'])
+    return header.get('RowIndices', []).index(ts_row) if 'RowIndices' in header else ts_row
+
+
+def restore_timestamps(header, data):
+    """
+    (rows, n) session samples with absolute Unix timestamps. float32 sessions store timestamps relative to
+    TimestampOrigin, so they come back as a float64 copy with the origin added. Other data is returned as is.
+    """
+    if (row := timestamp_index(header)) is None:
+        return data
+    data = np.array(data, dtype=np.float64)
+    data[row] += header['TimestampOrigin']
+    return data
+
+
+def open_session(sespath, mode='r'):
+    """
+    Memory map the binary data of a session. Compressed sessions (header "Codec") are decoded frame by frame
+    into memory instead.
+
+    Returns
+    -------
+    (header, data): header dict and a (rows, samples) view of the samples in data.bin
+    """
+    header = read_header(sespath)
+    dtype = np.dtype(header['DataType'])
+    rows = header['Rows']
+    binpath = os.path.join(sespath, BIN_NAME)
+    if header.get('Codec'):
+        return header, read_file(binpath, rows)
+    samples = os.path.getsize(binpath) // (dtype.itemsize * rows)  # Ignores a trailing partial sample
+    if not samples:
+        return header, np.empty((rows, 0), dtype=dtype)
+    mm = np.memmap(binpath, dtype=dtype, mode=mode, shape=(samples, rows))
+    return header, mm.T
+
+
+def read_range(sespath, start, stop):
+    """
+    Session samples [start, stop) read from data.bin into memory, with absolute timestamps (see
+    restore_timestamps). Compressed sessions only decode the frames holding them. Returns fewer samples if
+    data.bin does not reach stop yet.
+    """
+    header = read_header(sespath)
+    if header.get('Codec'):
+        with open(os.path.join(sespath, BIN_NAME), 'rb') as f:
+            chunks = list(iter_frames(f, start, stop))
+        data = np.hstack(chunks) if chunks else np.empty((header['Rows'], 0), dtype=header['DataType'])
+    else:
+        data = np.array(open_session(sespath)[1][:, start:stop])
+    return restore_timestamps(header, data)
+
+
+def export_csv(sespath, fname="data.csv"):
+    """Convert data.bin to the legacy channel-major text file read by upload_session.py, with absolute timestamps"""
+    header = read_header(sespath)
+    ts_index = timestamp_index(header)
+    origin = header.get('TimestampOrigin')
+
+    def absolute(r, row):
+        return row.astype(np.float64) + origin if r == ts_index else row
+
+    outpath = os.path.join(sespath, fname)
+    with open(outpath, 'wb') as f:
+        if header.get('Codec'):  # Decode frame by frame once per channel rather than the whole file at once
+            for r in range(header['Rows']):
+                with open(os.path.join(sespath, BIN_NAME), 'rb') as src:
+                    for i, chunk in enumerate(iter_frames(src)):
+                        f.write(b" " if i else b"")
+                        np.savetxt(f, absolute(r, chunk[r])[np.newaxis, :], fmt="%.9f", newline="")
+                f.write(b"\n")
+            return outpath
+        for r, row in enumerate(open_session(sespath)[1]):  # One channel at a time keeps memory bounded by a row
+            np.savetxt(f, absolute(r, row)[np.newaxis, :], fmt="%.9f")
+    return outpath
+
+
+class BinaryWriter:
+    """
+    Appends chunks as raw little-endian samples to data.bin, described by the data.json header, so per-drain
+    disk cost depends only on the size of the chunk. The file can be opened with open_session (np.memmap)
+    while it is still being written, and converted to the legacy CSV layout on demand with export_csv.
+
+    Parameters
+    ----------
+    sespath: str
+        Session directory
+    header: dict
+        Header from board_header describing rows, sample rate, dtype and channel map
+    flush_every: int
+        Number of written chunks between flushes to the OS (0 leaves flushing to the file buffer)
+    fsync: bool
+        Whether each flush should also be forced to disk with os.fsync
+    journal: Journal.Journal
+        Optional write-ahead journal indexing every chunk with a checksum. Its cadence decides when
+        data.bin and the journal are fsynced.
+    """
+    def __init__(self, sespath, header, flush_every=1, fsync=False, journal=None):
+        self.sespath = sespath
+        self.header = header
+        self.dtype = np.dtype(header['DataType'])
+        self.flush_every = flush_every
+        self.fsync = fsync
+        self.journal = journal
+        self.path = os.path.join(sespath, BIN_NAME)
+        self.file = None
+        self.chunks = 0
+        self.samples = 0
+        self.flushed = 0  # Samples handed to the OS, i.e. readable from data.bin by other threads and processes
+        self.offset = 0
+
+    def open(self):
+        if self.file is None or self.file.closed:
+            self.write_header()
+            self.offset = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+            self.file = open(self.path, 'ab')
+            if self.journal:
+                self.journal.record_header(self.header)
+
+    def write(self, chunk):
+        """Append a (rows, n) chunk as n samples"""
+        if not chunk.shape[1]:
+            return
+        self.open()
+        self.write_chunk(chunk)
+        self.chunks += 1
+        self.samples += chunk.shape[1]
+        if self.flush_every and self.chunks % self.flush_every == 0:
+            self.flush()
+
+    def encode(self, chunk):
+        return np.ascontiguousarray(chunk.T, dtype=self.dtype).tobytes()
+
+    def write_chunk(self, chunk):
+        payload = self.encode(chunk)
+        self.file.write(payload)
+        if self.journal:
+            self.journal.record_data(self.offset, payload)
+            if self.journal.due():
+                self.sync()
+        self.offset += len(payload)
+
+    def flush(self):
+        if self.file is None or self.file.closed:
+            return
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+        self.flushed = self.samples
+
+    def sync(self):
+        """Force data.bin and then its journal index to disk"""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.flushed = self.samples
+        self.journal.sync()
+
+    def write_header(self):
+        self.header['Samples'] = self.samples
+        with open(os.path.join(self.sespath, HEADER_NAME), 'w') as f:
+            json.dump(self.header, f, indent=4)
+
+    def close(self):
+        opened = self.file is not None and not self.file.closed
+        if opened and self.journal:
+            self.sync()
+        self.flush()
+        if opened:
+            self.file.close()
+            self.write_header()
+        if self.journal:
+            self.journal.close()
+
+
+class CompressedWriter(BinaryWriter):
+    """
+    BinaryWriter that stores each chunk as a lossless Codec frame (per-channel delta encoding and a stdlib
+    entropy coder). data.bin is then read with the streaming decoder in Codec rather than np.memmap.
+
+    Parameters
+    ----------
+    sespath: str
+        Session directory
+    header: dict
+        Header from board_header
+    coder: str
+        Entropy coder passed to Codec.encode ("zlib", "bz2" or "lzma")
+    **kwargs:
+        Passed to BinaryWriter
+    """
+    def __init__(self, sespath, header, coder="zlib", **kwargs):
+        super().__init__(sespath, header, **kwargs)
+        self.coder = coder
+        self.header['Codec'] = coder
+        scales = board_scales(header['BoardID'], BoardShim.get_num_rows(header['BoardID']))
+        self.scales = scales[header.get('RowIndices', slice(None))]
+
+    def encode(self, chunk):
+        return encode(chunk.astype(self.dtype, copy=False), self.scales, self.coder)
+
+
+class WriterMetrics:
+    """Backpressure counters shared by the collection thread (puts) and the writer thread (writes)"""
+    def __init__(self):
+        self.queued = 0  # Chunks handed to the writer
+        self.written = 0  # Chunks persisted by the writer
+        self.max_depth = 0  # Most chunks waiting in the queue at once
+        self.full_events = 0  # Handoffs that found the queue full
+        self.stall_time = 0.0  # Seconds the collection thread spent blocked on a full queue
+        self.max_lag = 0.0  # Longest time between a handoff and the chunk reaching the file
+        self.write_time = 0.0  # Seconds spent inside writer.write
+
+    @property
+    def depth(self):
+        return self.queued - self.written
+
+    def summary(self):
+        return (f"{self.written}/{self.queued} chunks written, max queue depth {self.max_depth}, "
+                f"{self.full_events} full-queue stalls ({self.stall_time:.3f}s), max lag {self.max_lag:.3f}s, "
+                f"write time {self.write_time:.3f}s")
+
+
+class WriterThread(Thread):
+    """
+    Persists chunks on a dedicated thread so disk I/O never delays the next board drain. The collection thread
+    hands chunks off through a bounded queue and only blocks (recorded in metrics) if the writer falls a full
+    queue behind.
+
+    Parameters
+    ----------
+    writer: BinaryWriter
+        Writer that persists each chunk (BinaryWriter or CompressedWriter)
+    maxsize: int
+        Maximum number of chunks waiting to be written
+    """
+    def __init__(self, writer, maxsize=8):
+        super().__init__(name="WriterThread", daemon=True)
+        self.writer = writer
+        self.maxsize = maxsize
+        self.queue = Queue(maxsize)
+        self.metrics = WriterMetrics()
+        self.exc = None
+        self.written = Condition()  # Notified after every chunk or requested flush
+
+    def put(self, chunk):
+        """Hand a drained chunk to the writer thread"""
+        queued = perf_counter()
+        try:
+            self.queue.put_nowait((chunk, queued))
+        except Full:
+            self.metrics.full_events += 1
+            self.queue.put((chunk, queued))
+            self.metrics.stall_time += perf_counter() - queued
+        self.metrics.queued += 1
+        self.metrics.max_depth = max(self.metrics.max_depth, self.metrics.depth)
+
+    def lagging(self):
+        """True once at least half of the queue is waiting on the disk"""
+        return self.metrics.depth >= max(1, self.maxsize // 2)
+
+    def run(self):
+        while (item := self.queue.get()) is not None:
+            chunk, queued = item
+            start = perf_counter()
+            try:
+                if chunk is None:  # Flush requested by wait_written
+                    self.writer.flush()
+                else:
+                    self.writer.write(chunk)
+            except Exception as e:  # Re-raised on the collection thread by the session's next save or close
+                self.exc = e
+            if chunk is not None:
+                end = perf_counter()
+                self.metrics.write_time += end - start
+                self.metrics.max_lag = max(self.metrics.max_lag, end - queued)
+                self.metrics.written += 1
+            with self.written:
+                self.written.notify_all()
+
+    def wait_written(self, samples, timeout=5.0):
+        """
+        Block until at least `samples` samples are flushed to data.bin, so other readers see them. Asks for a flush
+        first if they may be held back by flush_every. Returns False on timeout or writer failure.
+        """
+        if self.writer.flushed >= samples:
+            return True
+        if self.is_alive():
+            self.queue.put((None, perf_counter()))  # Behind the chunks still queued
+        with self.written:
+            return self.written.wait_for(lambda: self.writer.flushed >= samples or self.exc is not None
+                                         or not self.is_alive(), timeout) and self.writer.flushed >= samples
+
+    def close(self):
+        """Write everything still queued, then close the underlying writer"""
+        if self.is_alive():
+            self.queue.put(None)
+            self.join()
+        self.writer.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(prog='SessionWriter.py',
+                                     description='Converts a binary session (data.bin + data.json) to data.csv')
+    parser.add_argument('session_path', help="Path to session directory")
+    args = parser.parse_args()
+    print(f"Wrote {export_csv(os.path.abspath(args.session_path))}")
@@ -0,0 +1,176 @@
+"""Shared-memory ring buffer publishing live samples to other local processes"""
+from multiprocessing import shared_memory
+from time import sleep
+
+import json
+import numpy as np
+import os
+import struct
+
+MAGIC = b"NDR1"
+HEADER = struct.Struct("<4sHHIIdqQ")  # magic, version, itemsize, rows, capacity, srate, board id, write index
+INDEX_OFFSET = HEADER.size - 8  # Offset of the write index, the only header field that changes
+MAP_SIZE = 8192  # Bytes reserved for the JSON channel map
+DATA_OFFSET = 64 + MAP_SIZE
+VERSION = 1
+
+
+def data_bytes(rows, capacity, itemsize):
+    return rows * 2 * capacity * itemsize  # Every sample is stored twice so any window is contiguous
+
+
+class RingPublisher:
+    """
+    Creates a shared memory segment and publishes drained chunks into it. The segment holds a small header
+    (write index, sample rate, rows, capacity), a JSON channel map and a (rows, 2 * capacity) sample array.
+    Each sample is written at its ring position and again one capacity later, so the newest `capacity`
+    samples are always one contiguous slice that readers can view without copying.
+
+    Parameters
+    ----------
+    name: str
+        Shared memory name readers attach to
+    rows: int
+        Number of rows per sample
+    srate: int
+        Sampling rate in Hz
+    seconds: float
+        Seconds of data readers can look back
+    dtype: numpy dtype
+        Sample dtype
+    board_id: int
+        BrainFlow board id
+    channels: dict
+        Channel map published to readers, e.g. the data.json header fields
+    """
+    def __init__(self, name, rows, srate, seconds=10, dtype=np.float64, board_id=-1, channels=None):
+        self.rows = rows
+        self.capacity = max(1, int(srate * seconds))
+        self.dtype = np.dtype(dtype)
+        cmap = json.dumps(channels or {}).encode()
+        if len(cmap) > MAP_SIZE:
+            raise ValueError(f"Channel map too large for shared memory header ({len(cmap)} bytes).")
+        self.shm = shared_memory.SharedMemory(name=name, create=True,
+                                              size=DATA_OFFSET + data_bytes(rows, self.capacity, self.dtype.itemsize))
+        HEADER.pack_into(self.shm.buf, 0, MAGIC, VERSION, self.dtype.itemsize, rows, self.capacity, srate,
+                         board_id, 0)
+        self.shm.buf[64:64 + len(cmap)] = cmap
+        self.data = np.ndarray((rows, 2 * self.capacity), dtype=self.dtype, buffer=self.shm.buf, offset=DATA_OFFSET)
+        self.index = 0
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def publish(self, chunk):
+        """Copy a (rows, n) chunk into the ring, then advance the write index readers poll"""
+        n = chunk.shape[1]
+        if not n:
+            return
+        if n > self.capacity:  # Readers could never see the older part
+            chunk, skipped = chunk[:, n - self.capacity:], n - self.capacity
+        else:
+            skipped = 0
+        pos = (self.index + skipped) % self.capacity
+        for start in (pos, pos + self.capacity):
+            first = min(chunk.shape[1], 2 * self.capacity - start)
+            self.data[:, start:start + first] = chunk[:, :first]
+            if first < chunk.shape[1]:  # Second copy wraps to the front
+                self.data[:, :chunk.shape[1] - first] = chunk[:, first:]
+        self.index += n
+        struct.pack_into("<Q", self.shm.buf, INDEX_OFFSET, self.index)  # Data first, so readers never see unwritten samples
+
+    def close(self):
+        """Detach and remove the segment. Attached readers keep their mapping until they close."""
+        del self.data
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class RingReader:
+    """
+    Attaches to a RingPublisher segment from any local process
+
+    Parameters
+    ----------
+    name: str
+        Shared memory name given to the publisher
+    """
+    def __init__(self, name):
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:  # Python < 3.13 registers attached segments with the resource tracker, which unlinks them
+            self.shm = shared_memory.SharedMemory(name=name)
+            if os.name == "posix":
+                from multiprocessing import resource_tracker
+                resource_tracker.unregister(self.shm._name, "shared_memory")
+        magic, version, itemsize, self.rows, self.capacity, self.srate, self.board_id, _ = \
+            HEADER.unpack_from(self.shm.buf)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{name} is not a NeuroData sample ring.")
+        self.channels = json.loads(bytes(self.shm.buf[64:DATA_OFFSET]).rstrip(b"\0") or b"{}")
+        self.dtype = np.dtype(np.float32 if itemsize == 4 else np.float64)
+        self.data = np.ndarray((self.rows, 2 * self.capacity), dtype=self.dtype, buffer=self.shm.buf,
+                               offset=DATA_OFFSET)
+
+    @property
+    def index(self):
+        """Total samples published so far"""
+        return struct.unpack_from("<Q", self.shm.buf, INDEX_OFFSET)[0]
+
+    def latest(self, n):
+        """
+        Zero-copy view of the newest n samples (fewer if not yet published) and the session index of its
+        first sample. The view stays valid until the publisher writes over it; check with overwritten().
+        """
+        end = self.index
+        n = min(n, self.capacity, end)
+        stop = end % self.capacity + self.capacity
+        return end - n, self.data[:, stop - n:stop]
+
+    def since(self, start):
+        """Zero-copy view of samples published from session index `start` on, clipped to what is still held"""
+        end = self.index
+        start = min(max(start, end - self.capacity, 0), end)
+        stop = end % self.capacity + self.capacity
+        return start, self.data[:, stop - (end - start):stop]
+
+    def overwritten(self, start):
+        """True once the sample at session index `start` has left the ring, making older views invalid"""
+        return self.index - self.capacity > start
+
+    def wait(self, after, poll=0.005, timeout=None):
+        """Poll until more than `after` samples have been published. Returns the new index, or None on timeout."""
+        waited = 0.0
+        while (index := self.index) <= after:
+            if timeout is not None and waited >= timeout:
+                return None
+            sleep(poll)
+            waited += poll
+        return index
+
+    def close(self):
+        del self.data
+        self.shm.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(prog='SharedRing.py',
+                                     description='Attaches to a live session ring and prints incoming samples')
+    parser.add_argument('name', help="Shared memory name passed to CollectionSession(publish=...)")
+    parser.add_argument('-n', '--samples', type=int, default=1, help="Newest samples to print per update")
+    args = parser.parse_args()
+    reader = RingReader(args.name)
+    print(f"Attached to {args.name}: {reader.rows} rows at {reader.srate:g} Hz, {reader.capacity} samples held")
+    seen = reader.index
+    try:
+        while (seen := reader.wait(seen, timeout=5)) is not None:
+            start, view = reader.latest(args.samples)
+            print(f"[{start}] {np.array2string(view[:, -1], precision=3, max_line_width=200)}")
+    except KeyboardInterrupt:
+        pass
+    reader.close()
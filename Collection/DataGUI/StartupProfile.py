@@ -0,0 +1,83 @@
+"""Import and initialization timing for main.py --profile-startup"""
+from contextlib import contextmanager
+from time import perf_counter
+
+import builtins
+import sys
+
+
+class StartupProfile:
+    """
+    Times the first import of every module by wrapping builtins.__import__, plus named initialization phases.
+    Import times are inclusive (with nested imports) and self (without them). Only one thread should import
+    while installed, so uninstall before collection threads start.
+
+    Parameters
+    ----------
+    enabled: bool
+        When False, nothing is timed or printed, so callers need not check
+    stream: file
+        Where reports are printed
+    top: int
+        Number of modules listed per report, slowest self time first
+    """
+    def __init__(self, enabled=True, stream=sys.stderr, top=15):
+        self.enabled = enabled
+        self.stream = stream
+        self.top = top
+        self.origin = perf_counter()
+        self.original = builtins.__import__
+        self.imports = []  # (module, inclusive seconds, self seconds)
+        self.phases = []  # (phase, seconds)
+        self.nested = []  # Time spent in nested imports, one entry per import in progress
+        self.reported = (0, 0)  # Imports and phases already reported
+
+    def install(self):
+        if self.enabled:
+            builtins.__import__ = self.timed_import
+        return self
+
+    def uninstall(self):
+        if builtins.__import__ == self.timed_import:
+            builtins.__import__ = self.original
+
+    def timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name in sys.modules:
+            return self.original(name, globals, locals, fromlist, level)
+        self.nested.append(0.0)
+        start = perf_counter()
+        try:
+            return self.original(name, globals, locals, fromlist, level)
+        finally:
+            total = perf_counter() - start
+            nested = self.nested.pop()
+            if self.nested:
+                self.nested[-1] += total
+            self.imports.append((name, total, total - nested))
+
+    @contextmanager
+    def phase(self, name):
+        """Time the body of a with block as one initialization phase"""
+        if not self.enabled:
+            yield
+            return
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, perf_counter() - start))
+
+    def report(self, milestone):
+        """Print the phases and slowest imports since the previous report"""
+        if not self.enabled:
+            return
+        imports, phases = self.imports[self.reported[0]:], self.phases[self.reported[1]:]
+        self.reported = (len(self.imports), len(self.phases))
+        lines = [f"[Startup]: {milestone} at {perf_counter() - self.origin:.3f}s"]
+        lines += [f"    {name:<40} {seconds * 1000:>9.1f} ms" for name, seconds in phases]
+        if imports:
+            spent = sum(self_time for name, total, self_time in imports)
+            lines.append(f"    {len(imports)} modules imported in {spent * 1000:.1f} ms. Slowest (self / inclusive):")
+            for name, total, self_time in sorted(imports, key=lambda i: -i[2])[:self.top]:
+                lines.append(f"    {name:<40} {self_time * 1000:>9.1f} ms {total * 1000:>9.1f} ms")
+        print("\n".join(lines), file=self.stream, flush=True)
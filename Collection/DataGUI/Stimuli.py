@@ -1,58 +1,104 @@
 """Built-in Stimuli Classes"""
+import numpy as np
 import random
 import time
-import simplejson as json
 
-from PyQt5.QtWidgets import (QWidget, QGridLayout, QVBoxLayout, QOpenGLWidget)
+from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QOpenGLWidget)
 from PyQt5.QtCore import QThread, Qt, QRectF, pyqtSignal
-from PyQt5.QtGui import QColor, QPainter, QPainterPath, QBrush, QFont, QSurfaceFormat
+from PyQt5.QtGui import QColor, QGuiApplication, QImage, QPainter, QPainterPath, QBrush, QFont, QSurfaceFormat
 
 
-class FlashingThread(QThread):
-    flash_signal = pyqtSignal()
-
-    def __init__(self, frequency):
-        super().__init__()
-        self.frequency = frequency
-        self.is_running = True
-
-    def run(self):
-        interval = 1 / (2 * self.frequency)
-        while self.is_running:
-            self.flash_signal.emit()
-            self.msleep(int(1000 * interval))
-
-    def stop(self):
-        self.is_running = False
+class FlashGrid(QOpenGLWidget):
+    """
+    Draws every GridFlash cell in one GL pass per frame. Repainting is chained to frameSwapped, so with a swap
+    interval of 1 the loop runs once per vsync. Each cell's state comes from the frame number and the screen
+    refresh rate (white for the first half of every cycle), so frequencies hold at any grid size instead of
+    depending on thread sleeps. Frame numbers are rounded from elapsed time, so a missed vsync skips a frame (counted
+    in dropped) rather than shifting every later one, and early swaps cannot run ahead.
 
+    Per frame, the states of all cells are one numpy expression and drawing is two calls (one drawRects for the
+    white cells, one pre-rendered label overlay composited by difference so labels invert with their cell),
+    so Python work per frame does not grow with the number of boxes.
 
-class FlashingBox(QOpenGLWidget):
-    def __init__(self, frequency):
+    Parameters
+    ----------
+    frequencies: list
+        Flash frequency of each cell in Hz
+    rows: int
+        Number of rows in the grid
+    cols: int
+        Number of columns in the grid
+    spacing: int
+        Pixels between cells
+    """
+    def __init__(self, frequencies, rows, cols, spacing=6):
+        fmt = QSurfaceFormat()
+        fmt.setSamples(4)
+        fmt.setSwapInterval(1)  # Swap on vsync, which paces the render loop
+        fmt.setSwapBehavior(QSurfaceFormat.DoubleBuffer)
+        fmt.setRenderableType(QSurfaceFormat.OpenGL)
+        QSurfaceFormat.setDefaultFormat(fmt)  # Some platforms only apply the swap interval from the default format
         super().__init__()
-        self.frequency = frequency
-        self.flash_state = False
-        self.flashing_thread = FlashingThread(frequency)
-        self.flashing_thread.flash_signal.connect(self.toggle_flash)
-        self.flashing_thread.start()
-
-    def toggle_flash(self):
-        self.flash_state = not self.flash_state
+        self.setFormat(fmt)
+        self.frequencies = np.asarray(frequencies, dtype=np.float64)
+        self.rows, self.cols, self.spacing = rows, cols, spacing
+        self.cells = []
+        self.labels = None
+        self.refresh = 60.0
+        self.start = None
+        self.frame = 0
+        self.dropped = 0
+        self.running = False
+        self.frameSwapped.connect(self.next_frame)
+
+    def start_flashing(self):
+        handle = self.window().windowHandle()
+        screen = handle.screen() if handle else QGuiApplication.primaryScreen()
+        self.refresh = screen.refreshRate() or 60.0
+        self.start, self.frame, self.dropped = None, 0, 0
+        self.running = True
         self.update()
 
-    def paintGL(self):
-        painter = QPainter(self)
-        painter.setRenderHint(QPainter.Antialiasing)
-        color = QColor(Qt.black) if self.flash_state else QColor(Qt.white)
-        painter.setBrush(QBrush(color))
-
-        painter.drawRect(self.rect())
-        painter.setPen(QColor(Qt.black) if not self.flash_state else QColor(Qt.white))
+    def stop_flashing(self):
+        self.running = False
+
+    def next_frame(self):
+        if self.running:
+            self.update()
+
+    def resizeGL(self, w, h):
+        """Lay out the cells and pre-render their labels for the new size"""
+        cw = (w - self.spacing * (self.cols + 1)) / self.cols
+        ch = (h - self.spacing * (self.rows + 1)) / self.rows
+        self.cells = [QRectF(self.spacing + c * (cw + self.spacing), self.spacing + r * (ch + self.spacing), cw, ch)
+                      for r in range(self.rows) for c in range(self.cols)][:len(self.frequencies)]
+        self.labels = QImage(max(1, w), max(1, h), QImage.Format_ARGB32_Premultiplied)
+        self.labels.fill(Qt.transparent)
+        painter = QPainter(self.labels)
+        painter.setPen(QColor(Qt.white))
         painter.setFont(QFont('Arial', 16))
-        painter.drawText(self.rect(), Qt.AlignCenter, f'{self.frequency:.1f} Hz')
+        for cell, frequency in zip(self.cells, self.frequencies):
+            painter.drawText(cell, Qt.AlignCenter, f'{frequency:.1f} Hz')
+        painter.end()
 
-    def closeEvent(self, event):
-        self.flashing_thread.stop()
-        self.flashing_thread.wait()
+    def paintGL(self):
+        now = time.monotonic()
+        if self.start is None:
+            self.start = now
+        frame = round((now - self.start) * self.refresh)  # Follows elapsed time whether swaps run late or early
+        self.dropped += max(0, frame - self.frame - 1)
+        self.frame = frame
+        white = (self.frame / self.refresh * self.frequencies) % 1 < 0.5
+
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor(Qt.black))
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(QBrush(QColor(Qt.white)))
+        painter.drawRects([self.cells[i] for i in np.flatnonzero(white[:len(self.cells)])])
+        if self.labels is not None:
+            painter.setCompositionMode(QPainter.CompositionMode_Difference)  # White text reads black on white
+            painter.drawImage(0, 0, self.labels)
+        painter.end()
 
 
 class GridFlash(QWidget):
@@ -69,11 +115,13 @@ class GridFlash(QWidget):
         number of columns in grid
     """
     exit_sig = pyqtSignal()
+    onset_sig = pyqtSignal(str)  # Stimulus onset label, marked on the sample clock by CollectionWindow
 
     def __init__(self, frequencies: list, rows: int, cols: int):
         super().__init__()
         self.setWindowTitle("Grid Flash Stimulus")
-        layout = QGridLayout()
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
         self.frequencies = frequencies
         self.active = True
         self.setLayout(layout)
@@ -83,34 +131,24 @@ class GridFlash(QWidget):
         p.setColor(self.backgroundRole(), Qt.black)
         self.setPalette(p)
 
-        n = 0
-        for i in range(rows):
-            for j in range(cols):
-                if n < len(frequencies):
-                    box = FlashingBox(frequencies[n])
-                    layout.addWidget(box, i, j)
-                    n += 1
-
-        fmt = QSurfaceFormat()
-        fmt.setSamples(4)
-        fmt.setSwapInterval(1)
-        fmt.setSwapBehavior(QSurfaceFormat.DoubleBuffer)
-        fmt.setRenderableType(QSurfaceFormat.OpenGL)
-        QSurfaceFormat.setDefaultFormat(fmt)
+        self.grid = FlashGrid(frequencies, rows, cols)
+        layout.addWidget(self.grid)
 
     def keyPressEvent(self, event):
         if event.key() == Qt.Key_Escape:
             self.close()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.grid.start_flashing()
+        self.onset_sig.emit("GridFlash")
     
-    def add_info(self, infopath):
-        with open(infopath, 'r+') as i:
-            info = json.loads(i.read())
-            info['Description'] += f"\n\nGrid Flash Frequencies: {[round(f, 2) for f in self.frequencies]}"
-            i.seek(0)
-            json.dump(info, i, indent=4, ensure_ascii=True)
-            i.truncate()
+    def describe(self):
+        """Text appended to the session description in info.json"""
+        return f"\n\nGrid Flash Frequencies: {[round(f, 2) for f in self.frequencies]}"
 
     def closeEvent(self, event):
+        self.grid.stop_flashing()
         self.exit_sig.emit()
 
 
@@ -139,6 +177,8 @@ class ToggleThread(QThread):
 
 
 class PromptBox(QOpenGLWidget):
+    onset_sig = pyqtSignal()
+
     def __init__(self, text, times, dur, stime):
         super().__init__()
         self.text = text
@@ -154,6 +194,8 @@ class PromptBox(QOpenGLWidget):
     def toggle_flash(self):
         self.flash_state = not self.flash_state
         self.update()
+        if self.flash_state:
+            self.onset_sig.emit()
 
     def paintGL(self):
         painter = QPainter(self)
@@ -193,6 +235,7 @@ class RandomPrompt(QWidget):
         How long to leave the prompt on the screen
     """
     exit_sig = pyqtSignal()
+    onset_sig = pyqtSignal(str)  # Stimulus onset label, marked on the sample clock by CollectionWindow
 
     def __init__(self, prompt: str, ppb: int, cooldown: int, stimcycle: str, blength: int, dur: float = 1.5):
         super().__init__()
@@ -262,15 +305,12 @@ class RandomPrompt(QWidget):
     def start(self):
         self.active = True
         box = PromptBox(self.prompt, self.times, self.dur, time.time())
+        box.onset_sig.connect(lambda: self.onset_sig.emit("Prompt"))
         self.layout.addWidget(box)
     
-    def add_info(self, infopath):
-        with open(infopath, 'r+') as i:
-            info = json.loads(i.read())
-            info['Description'] += f"\n\nRandom Prompt Times: {[round(t, 2) for t in self.times]}\nPrompt Text: {self.prompt}"
-            i.seek(0)
-            json.dump(info, i, indent=4, ensure_ascii=True)
-            i.truncate()
+    def describe(self):
+        """Text appended to the session description in info.json"""
+        return f"\n\nRandom Prompt Times: {[round(t, 2) for t in self.times]}\nPrompt Text: {self.prompt}"
 
     def closeEvent(self, event):
         self.exit_sig.emit()
@@ -0,0 +1,234 @@
+"""Streaming of live session data to local or remote subscribers over TCP or Unix sockets"""
+from queue import Queue, Full
+from threading import Thread, Lock
+
+import json
+import numpy as np
+import os
+import socket
+import struct
+
+HELLO_MAGIC = b"NDH1"
+FRAME_MAGIC = b"NDF1"
+HELLO = struct.Struct("<4sI")  # magic, JSON header length
+FRAME = struct.Struct("<4sQQIII")  # magic, sequence number, first sample index, samples, rows, payload length
+
+
+def parse_address(address):
+    """"host:port" or (host, port) for TCP, anything else is a Unix socket path"""
+    if isinstance(address, tuple):
+        return socket.AF_INET, address
+    host, sep, port = str(address).rpartition(":")
+    if sep and port.isdigit():
+        return socket.AF_INET, (host or "127.0.0.1", int(port))
+    if not hasattr(socket, "AF_UNIX"):
+        raise ValueError(f"Unix sockets are not supported here, use host:port instead of {address}.")
+    return socket.AF_UNIX, address
+
+
+def pack_frame(seq, start, chunk, dtype):
+    payload = np.ascontiguousarray(chunk.T, dtype=dtype).tobytes()  # Sample-major, like data.bin
+    return FRAME.pack(FRAME_MAGIC, seq, start, chunk.shape[1], chunk.shape[0], len(payload)) + payload
+
+
+class Subscriber(Thread):
+    """Sends queued frames to one client so a slow connection only ever delays itself"""
+    def __init__(self, conn, addr, maxsize):
+        super().__init__(name=f"Subscriber {addr}", daemon=True)
+        self.conn = conn
+        self.addr = addr
+        self.queue = Queue(maxsize)
+        self.alive = True
+
+    def offer(self, frame):
+        """Queue a frame without blocking. Returns False if the client is gone or its queue is full."""
+        if not self.alive:
+            return False
+        try:
+            self.queue.put_nowait(frame)
+            return True
+        except Full:
+            return False
+
+    def run(self):
+        try:
+            while (frame := self.queue.get()) is not None:
+                self.conn.sendall(frame)
+        except OSError:  # Client disconnected
+            pass
+        finally:
+            self.alive = False
+            self.conn.close()
+
+    def close(self):
+        """Stop after the frames already queued, or immediately if the queue is full"""
+        self.alive = False
+        try:
+            self.queue.put_nowait(None)
+        except Full:
+            try:
+                self.conn.shutdown(socket.SHUT_RDWR)  # Unblocks a sendall stuck on the slow client
+            except OSError:
+                pass
+            self.conn.close()
+
+
+class StreamServer(Thread):
+    """
+    Accepts subscribers and pushes framed binary chunks to each of them. Every frame carries a sequence number
+    and the session index range of its samples. Each subscriber has a bounded queue drained by its own thread;
+    a subscriber whose queue fills up is disconnected, so broadcasting never blocks acquisition.
+
+    Parameters
+    ----------
+    address: str or tuple
+        "host:port" (TCP, e.g. "0.0.0.0:5555" to serve a second machine) or a Unix socket path
+    header: dict
+        Stream description sent to every subscriber on connect (rows, sample rate, dtype, channel map)
+    maxsize: int
+        Frames a subscriber may fall behind before it is dropped
+    """
+    def __init__(self, address, header, maxsize=32):
+        super().__init__(name="StreamServer", daemon=True)
+        self.family, self.address = parse_address(address)
+        self.header = header
+        self.dtype = np.dtype(header['DataType'])
+        self.hello = json.dumps(header).encode()
+        self.maxsize = maxsize
+        self.lock = Lock()
+        self.subscribers = []
+        self.seq = 0
+        self.dropped = 0
+        self.sock = socket.socket(self.family, socket.SOCK_STREAM)
+        if self.family == socket.AF_INET:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(self.address)
+        self.sock.listen()
+
+    def run(self):
+        while True:
+            try:
+                conn, addr = self.sock.accept()
+            except OSError:  # Socket closed by close()
+                return
+            if self.family == socket.AF_INET:
+                conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sub = Subscriber(conn, addr or "local", self.maxsize)
+            sub.offer(HELLO.pack(HELLO_MAGIC, len(self.hello)) + self.hello)
+            sub.start()
+            with self.lock:
+                self.subscribers.append(sub)
+
+    def broadcast(self, chunk, start):
+        """Frame a (rows, n) chunk whose first sample has session index `start` and queue it for every subscriber"""
+        if not chunk.shape[1]:
+            return
+        frame = pack_frame(self.seq, start, chunk, self.dtype)
+        self.seq += 1
+        with self.lock:
+            for sub in self.subscribers:
+                if not sub.offer(frame):
+                    if sub.alive:  # Too slow, drop it rather than wait
+                        self.dropped += 1
+                    sub.close()
+            self.subscribers = [sub for sub in self.subscribers if sub.alive]
+
+    def close(self):
+        """Stop accepting and disconnect every subscriber once its queued frames are sent"""
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)  # Wakes accept() so the thread exits before the port is reused
+        except OSError:
+            pass
+        self.sock.close()
+        if self.is_alive():
+            self.join()
+        with self.lock:
+            for sub in self.subscribers:
+                sub.close()
+            self.subscribers = []
+        if self.family == getattr(socket, "AF_UNIX", None):
+            if os.path.exists(self.address):
+                os.remove(self.address)
+
+    def summary(self):
+        with self.lock:
+            count = len(self.subscribers)
+        return f"{self.seq} frames streamed, {count} subscribers connected, {self.dropped} slow subscribers dropped"
+
+
+class StreamClient:
+    """
+    Subscribes to a StreamServer
+
+    Parameters
+    ----------
+    address: str or tuple
+        Address the server listens on
+    timeout: float
+        Socket timeout in seconds (None blocks)
+    """
+    def __init__(self, address, timeout=None):
+        family, addr = parse_address(address)
+        self.sock = socket.create_connection(addr, timeout) if family == socket.AF_INET else \
+            socket.socket(family, socket.SOCK_STREAM)
+        if family != socket.AF_INET:
+            self.sock.settimeout(timeout)
+            self.sock.connect(addr)
+        magic, length = HELLO.unpack(self.read(HELLO.size))
+        if magic != HELLO_MAGIC:
+            raise ValueError("Not a NeuroData stream.")
+        self.header = json.loads(self.read(length))
+        self.dtype = np.dtype(self.header['DataType'])
+        self.last_seq = None
+
+    def read(self, size):
+        buf = bytearray(size)
+        view, got = memoryview(buf), 0
+        while got < size:
+            n = self.sock.recv_into(view[got:])
+            if not n:
+                raise EOFError("Stream closed.")
+            got += n
+        return bytes(buf)
+
+    def recv(self):
+        """
+        Next frame from the server
+
+        Returns
+        -------
+        (seq, start, chunk): sequence number, session index of the first sample, and the (rows, n) samples,
+        or None once the server closes the stream
+        """
+        try:
+            magic, seq, start, n, rows, length = FRAME.unpack(self.read(FRAME.size))
+            if magic != FRAME_MAGIC:
+                raise ValueError("Corrupt stream frame.")
+            chunk = np.frombuffer(self.read(length), dtype=self.dtype).reshape(n, rows).T
+        except EOFError:
+            return None
+        self.last_seq = seq
+        return seq, start, chunk
+
+    def __iter__(self):
+        while (frame := self.recv()) is not None:
+            yield frame
+
+    def close(self):
+        self.sock.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(prog='StreamServer.py',
+                                     description='Subscribes to a live session stream and prints each frame')
+    parser.add_argument('address', help="host:port or Unix socket path passed to CollectionSession(serve=...)")
+    args = parser.parse_args()
+    client = StreamClient(args.address)
+    print(f"Connected: {client.header['Rows']} rows at {client.header['SampleRate']} Hz")
+    try:
+        for seq, start, chunk in client:
+            print(f"Frame {seq}: samples {start}-{start + chunk.shape[1] - 1}")
+    except KeyboardInterrupt:
+        pass
+    client.close()
@@ -3,7 +3,6 @@ import math
 
 from abc import ABC, ABCMeta, abstractmethod
 from collections import namedtuple
-from numpy import linspace
 from PyQt5.QtCore import Qt, QFileSystemWatcher
 from PyQt5.QtGui import QIntValidator, QDoubleValidator
 from PyQt5.QtWidgets import QFrame, QPlainTextEdit, QGridLayout, QLabel, QLineEdit
@@ -105,6 +104,7 @@ class GridStimMenu(QGridLayout, StimMenu):
         """Return usable args for running the stim script"""
         rows = cols = math.ceil(math.sqrt(int(self.fields.stepfield.text())))
         min, max, steps = int(self.fields.minfield.text()), int(self.fields.maxfield.text()), int(self.fields.stepfield.text())
+        from numpy import linspace  # Deferred so startup does not load numpy
         return linspace(min, max, steps), rows, cols
 
 
@@ -1,47 +1,22 @@
-import BoardBridge
-import BoardlessBridge
-
-from brainflow import BrainFlowInputParams, BrainFlowError, LogLevels
-from brainflow.board_shim import BoardShim
+"""
+Pages of the collection GUI. BrainFlow, the bridges, numpy and the stimulus scripts are imported where they are
+first needed (mode chosen, session started, stimulus configured) so the mode window opens without loading them.
+See main.py --profile-startup.
+"""
 from datetime import datetime
-from PyQt5.QtCore import Qt, QTimer, QTime, pyqtSignal, pyqtSlot
+from time import monotonic
+from PyQt5.QtCore import Qt, QObject, QTimer, QTime, pyqtSignal, pyqtSlot
 from PyQt5.QtGui import QIntValidator
 from PyQt5.QtWidgets import (QFrame, QLabel, QLineEdit, QTextEdit, QComboBox, QPushButton, QFileDialog, 
                              QVBoxLayout, QHBoxLayout, QGridLayout)
-from threading import Thread
-from time import sleep
+from SessionInfo import (BOARDMAP, BUFFSIZE_DEFAULT, BUFFSIZE_MAX, BUFFSIZE_MIN, BLENGTH_MAX, BCOUNT_MAX,
+                         check_fields, create_empty_info, create_session, fill_info)
 from Style import StateIndicator, QTextEditLogger, GridStimMenu, RandomPromptMenu
-from Stimuli import GridFlash, RandomPrompt
 
 import json
 import os
 
 
-def create_empty_info():
-    return {
-        "SessionParams": {
-            "SubjectName": "",
-            "ProjectName": "",
-            "ResponseType": "",
-            "StimulusType": "",
-            "BlockLength": "",
-            "BlockCount": "",
-            "StimCycle": ""
-        },
-        "HardwareParams": {
-            "SampleRate": "",
-            "HeadsetConfiguration": "",
-            "HeadsetModel": "",
-            "BufferSize": "100000"
-        },
-        "Description": "",
-        "Annotations": [],
-        "Date": datetime.now().strftime("%m-%d-%y"),
-        "Time": datetime.now().strftime("%H:%M"),
-        "FileID": ""
-        }
-
-
 def init_combobox(cbox, default, *options):
     cbox.setCurrentText(default)
     cbox.addItems(options)
@@ -55,6 +30,14 @@ class PageWindow(QFrame):
         self.gosig.emit(name, reset)
 
 
+class SessionSignals(QObject):
+    """Re-emits CollectionSession notifications as a Qt signal, so connected slots run on the GUI thread"""
+    changed = pyqtSignal(object, str)  # Session state, error message
+
+    def notify(self, state, error):
+        self.changed.emit(state, error)
+
+
 class ModeWindow(PageWindow):
     """Choose between test and regular mode."""
     modesig = pyqtSignal(bool)
@@ -83,15 +66,20 @@ class ModeWindow(PageWindow):
 
 class InfoWindow(PageWindow):
     """Accepts and validates input for info.json"""
-    boardmap = {'Cyton': (0, 250),
-                'CytonDaisy': (2, 125)}
-    stimmap = {'GridFlash': GridFlash,
-               'RandomPrompt': RandomPrompt}
-    buffsize_d = 100000
-    buffsize_max = 450000
-    buffsize_min = 3000
-    blengthmax = 3600
-    bcountmax = 360
+    boardmap = BOARDMAP
+    rowmap = {'All rows': None,  # Stored row groups (SessionWriter.ROW_GROUPS), None keeps every board row
+              'EEG + timing + markers': ("EEG", "Timestamp", "Marker"),
+              'EEG + accel + timing + markers': ("EEG", "Accel", "Timestamp", "Marker"),
+              'EEG only': ("EEG",)}
+    dtypemap = ('float64', 'float32')  # Storage dtypes by numpy name
+    memorymap = {'RAM: whole session': None,  # Seconds kept in memory, older samples are read back from disk
+                 'RAM: last 1 min': 60,
+                 'RAM: last 10 min': 600}
+    buffsize_d = BUFFSIZE_DEFAULT
+    buffsize_max = BUFFSIZE_MAX
+    buffsize_min = BUFFSIZE_MIN
+    blengthmax = BLENGTH_MAX
+    bcountmax = BCOUNT_MAX
 
     def __init__(self, collection_window, boardless=False):
         """Create elements"""
@@ -157,6 +145,7 @@ class InfoWindow(PageWindow):
         self.buffsize = QLabel("Buffer size (samples):")
         self.serialport = QLabel("Board serial port: ")
         self.stimscript = QLabel("Stimulus script:")
+        self.storage = QLabel("Storage:")
         self.fconfig = QComboBox()
         init_combobox(self.fconfig, "standard", "Standard", "Occipital", "Other")
         self.fmodel = QComboBox()
@@ -169,6 +158,12 @@ class InfoWindow(PageWindow):
         self.fstimscript = QComboBox()
         init_combobox(self.fstimscript, "External/None", "External/None", "Grid Flash", "Random Prompting")
         self.fstimscript.currentTextChanged.connect(self.stim_config)
+        self.frows = QComboBox()
+        init_combobox(self.frows, "All rows", *InfoWindow.rowmap)
+        self.fdtype = QComboBox()
+        init_combobox(self.fdtype, "float64", *InfoWindow.dtypemap)
+        self.fmemory = QComboBox()
+        init_combobox(self.fmemory, "RAM: whole session", *InfoWindow.memorymap)
 
         # Confirmation
         self.confirm_button = QPushButton("Confirm")
@@ -219,6 +214,12 @@ class InfoWindow(PageWindow):
         hardlayout.setRowStretch(6, 5)
         hardlayout.setRowStretch(7, 1)
         hardlayout.setRowMinimumHeight(6, 2)
+        storagelayout = QHBoxLayout()
+        storagelayout.addWidget(self.frows, 2)
+        storagelayout.addWidget(self.fdtype, 1)
+        storagelayout.addWidget(self.fmemory, 2)
+        hardlayout.addWidget(self.storage, 0, 0)
+        hardlayout.addLayout(storagelayout, 0, 1)
         hardlayout.addWidget(self.config, 1, 0)
         hardlayout.addWidget(self.fconfig, 1, 1)
         hardlayout.addWidget(self.model, 2, 0)
@@ -273,6 +274,13 @@ class InfoWindow(PageWindow):
 
     def start(self, new):
         """Create new collection session and proceed to collection window"""
+        if self.boardless:
+            import BoardlessBridge as bridge
+        else:
+            import BoardBridge as bridge
+        from brainflow import BrainFlowInputParams, BrainFlowError
+        from brainflow.board_shim import BoardShim
+
         if new:
             params = BrainFlowInputParams()
             params.serial_port = self.fserialport.text()
@@ -283,102 +291,47 @@ class InfoWindow(PageWindow):
                 self.errlabel.setText(f"Error creating BoardShim object.\n{E}")
                 return
 
-        if self.boardless:
-            session = BoardlessBridge.CollectionSession(self.board, self.sespath, int(self.fbuffsize.text()))
-        else:
-            session = BoardBridge.CollectionSession(self.board, self.sespath, int(self.fbuffsize.text()))
+        session = bridge.CollectionSession(self.board, self.sespath, int(self.fbuffsize.text()),
+                                           rowgroups=InfoWindow.rowmap[self.frows.currentText()],
+                                           dtype=self.fdtype.currentText(),
+                                           memory_seconds=InfoWindow.memorymap[self.fmemory.currentText()])
+
+        if self.boardless:  # Simulated EEG responds to the session's stimulus
+            session.sim.configure(self.fstimcycle.text().strip(), int(self.fblength.text()), self.stimscript)
 
         ipath = os.path.join(self.sespath, "info.json")
-        if self.stimscript:
-            self.stimscript.add_info(ipath)
         self.colwin.init_session(ipath, session, new, stim=self.stimscript)
         self.goto("collect")
 
     def check_info(self):
         """Validate info"""
-        if not self.curdir.text().strip():
-            return False, "No session directory supplied."
-        if "data.csv" in os.listdir(self.curdir.text().strip()):
-            return False, "Data file already in target directory."
-        if "info.json" in os.listdir(self.curdir.text().strip()):
-            return False, "Info JSON already in target directory."
-        if not self.fsname.text().strip():
-            return False, "No subject name supplied."
-        if not self.fpname.text().strip():
-            return False, "No project name supplied."
-        bl = self.fblength.text().strip()
-        if not bl:
-            return False, "No block length supplied."
-        bl = int(bl)
-        if bl < 1:
-            return False, "Block length must be positive."
-        if bl > self.blengthmax:
-            return False, f"Block length too high. (Max: {self.blengthmax})"
-        bc = self.fbcount.text().strip()
-        if not bc:
-            return False, "No block count supplied."
-        bc = int(bc)
-        if bc < 1:
-            return False, "Block count must be positive."
-        elif bc > self.bcountmax:
-            return False, f"Block count too high. (Max: {self.bcountmax})"
-
-        if not self.fstimcycle.text().strip():
-            return False, "No stimulus cycle supplied."
-        stimcycle = self.fstimcycle.text().strip()
-        test = stimcycle.replace("1", "").replace("0", "")
-        if len(test):
-            return False, "Invalid characters in stim cycle."
-        if len(stimcycle) != bc:
-            return False, "Stim cycle does not match block count."
-        if not self.fdescription.toPlainText().strip(" "):
-            return False, "No session description supplied."
-        if not self.fbuffsize.text().strip():
-            return False, "No buffer size supplied."
-        if int(self.fbuffsize.text()) > self.buffsize_max:
-            return False, f"Buffer size too high. (Max: {self.buffsize_max})"
-        if int(self.fbuffsize.text()) < self.buffsize_min:
-            return False, f"Buffer size too low. (Min: {self.buffsize_min})"
-        if not self.fserialport.text().strip():
-            return False, "No serial port supplied."
-        
+        res = check_fields(self.curdir.text(), self.fsname.text(), self.fpname.text(), self.fblength.text(),
+                           self.fbcount.text(), self.fstimcycle.text(), self.fdescription.toPlainText(),
+                           self.fbuffsize.text(), self.fserialport.text())
+        if not res[0]:
+            return res
+
         menu = self.hardlayout.itemAtPosition(6, 0)
         if menu and not (res := menu.validate(self))[0]:
             return res
         elif not menu:
             self.stimscript = None
         else:
-            self.stimscript = InfoWindow.stimmap[menu.stimname](*menu.get_args())
+            import Stimuli
+            self.stimscript = getattr(Stimuli, menu.stimname)(*menu.get_args())
 
         return True, ""
 
     def save_info(self):
         """"Save info as info.json"""
-        info = self.infodict
-        info['SessionParams']['SubjectName'] = self.fsname.text().strip()
-        info['SessionParams']['ProjectName'] = self.fpname.text().strip()
-        info['SessionParams']['ResponseType'] = self.frtype.currentText()
-        info['SessionParams']['StimulusType'] = self.fstype.currentText()
-        blength, bcount = self.fblength.text(), self.fbcount.text()
-        info['SessionParams']['BlockLength'] = blength
-        info['SessionParams']['BlockCount'] = bcount
-        info['SessionParams']['StimCycle'] = self.fstimcycle.text().strip()
-        info['HardwareParams']['HeadsetConfiguration'] = self.fconfig.currentText()
-        model = self.fmodel.currentText()
-        info['HardwareParams']['HeadsetModel'] = model
-        info['HardwareParams']['SampleRate'] = str(self.boardmap[model][1])
-        info['HardwareParams']['BufferSize'] = str(self.fbuffsize.text())
-        info['Description'] = self.fdescription.toPlainText().strip()
-
-        bcount = int(bcount)
-        blength = int(blength)
-        info['Annotations'] += [(float(blength*k), f"Block{k}") for k in range(1, bcount+1)]
-
-        suffix = self.date + "_" + str(datetime.now().timestamp()).split(".")[1]
-        self.sespath = os.path.join(self.curdir.text(), f"session_{suffix}")
-        os.makedirs(self.sespath, exist_ok=True, mode=0o777)
-        with open(os.path.join(self.sespath, "info.json"), 'w') as f:
-            json.dump(info, f, ensure_ascii=False, indent=4)
+        info = fill_info(self.infodict, self.fsname.text(), self.fpname.text(), self.frtype.currentText(),
+                         self.fstype.currentText(), self.fblength.text(), self.fbcount.text(), self.fstimcycle.text(),
+                         self.fconfig.currentText(), self.fmodel.currentText(), self.fbuffsize.text(),
+                         self.fdescription.toPlainText(),
+                         InfoWindow.rowmap[self.frows.currentText()], self.fdtype.currentText())
+        if self.stimscript:
+            info['Description'] += self.stimscript.describe()
+        self.sespath = create_session(self.curdir.text(), info)
 
     def get_directory(self):
         dir = QFileDialog.getExistingDirectory(self, "Choose a directory")
@@ -431,13 +384,20 @@ class CollectionWindow(PageWindow):
         self.stim = stim
         if self.stim:
             self.stim.exit_sig.connect(self.end_stim)
+            self.stim.onset_sig.connect(self.mark_onset)
 
         self.session_status = "Preparing"
         self.current_block = 0
         self.start_time = None
         self.t = 0
         self.complete = False
-        self.timer = QTimer(self)
+        self.timer = QTimer(self)  # Session clock, armed one tick at a time (see schedule_tick)
+        self.timer.setSingleShot(True)
+        self.timer.setTimerType(Qt.PreciseTimer)
+        self.clock_start = None
+        self.signals = SessionSignals(self)
+        self.signals.changed.connect(self.on_session_state)
+        self.csession.add_listener(self.signals.notify)
 
         if new:
             self.build_frame()
@@ -462,10 +422,11 @@ class CollectionWindow(PageWindow):
         infslabel = QLabel("Session status:")
         infslabel.setStyleSheet("font-weight: bold")
         block_status = QLabel()
+        lost_label = QLabel("Samples lost: 0")
         self.state_indicator = StateIndicator("#04d481", "black")
         self.status_panel = StatusPanel(status_label, status_info, block_status, 
                                         timer_label, stimer_label, 
-                                        self.state_indicator, infslabel)
+                                        self.state_indicator, infslabel, lost_label)
 
         # Buttons and top level widgets
         self.entry_button = QPushButton("Mark Event")
@@ -486,6 +447,11 @@ class CollectionWindow(PageWindow):
         log_label.setObjectName("FieldLabels")
         self.log_panel = LogPanel(self.infopath, log_label, self.csession)
 
+        # Animates the "Preparing..." and "Collecting..." status on the GUI thread
+        self.status_timer = QTimer(self)
+        self.status_timer.timeout.connect(self.animate_status)
+        self.status_text, self.status_dots = "", 0
+
     def fill_frame(self):
         """Inserts widgets in layouts"""
         layout = QVBoxLayout()
@@ -515,43 +481,48 @@ class CollectionWindow(PageWindow):
         self.log_panel.reset(self.infopath, self.csession)
         self.status_panel.set_block_time("00:00")
         self.status_panel.set_session_time("00:00")
+        self.status_panel.set_lost(0)
         self.update_status()
-        ready_thread = Thread(target=self.wait_for_ready, name="ReadyThread")
-        ready_thread.start()
+        self.show_progress("Preparing")
         self.csession.start()
 
-    def wait_for_ready(self):
-        """Show preparation status"""
-        i = 0
-        while not (ready := self.ready_flag.is_set()) and not self.error_flag.is_set() and not self.stop_event.is_set():
-            infostat = "Preparing" + "." * i
-            self.status_panel.set_session_status(infostat)
-            i = (i+1) % 4
-            sleep(0.5)
-        if ready:
+    @pyqtSlot(object, str)
+    def on_session_state(self, state, error):
+        """Show session state changes and errors, queued from the collection thread"""
+        if self.error_flag.is_set():
+            self.status_timer.stop()
+            self.status_panel.set_session_status(error or self.csession.get_error(), error=True)
+            if self.timer.isActive():
+                self.stop_session()
+        elif state == self.csession.State.READY:
+            self.status_timer.stop()
             self.status_panel.set_session_status("Ready")
             self.start_button.setDisabled(False)
-        elif self.error_flag.is_set():
-            infostat = self.csession.get_error()
-            self.status_panel.set_session_status(infostat, error=True)
-
-    def show_ongoing(self):
-        """Show collecting status"""
-        i = 0
-        while not self.stop_event.is_set() and not self.error_flag.is_set():
-            infostat = "Collecting" + "." * i
-            self.status_panel.set_session_status(infostat)
-            i = (i+1) % 4
-            sleep(0.5)
+        elif state == self.csession.State.STREAMING:
+            self.show_progress("Collecting")
+
+    def show_progress(self, text):
+        """Show an animated status until the next state change"""
+        self.status_text, self.status_dots = text, 0
+        self.animate_status()
+        self.status_timer.start(500)
+
+    def animate_status(self):
+        self.status_panel.set_session_status(self.status_text + "." * self.status_dots)
+        self.status_dots = (self.status_dots + 1) % 4
+
+    def log(self, message):
+        """Log an INFO message to the session log"""
+        from brainflow import LogLevels  # Already loaded with the session's bridge
+        self.csession.log_message(LogLevels.LEVEL_INFO, message)
 
     def add_annotation(self, time, note):
-        self.info['Annotations'].append([time, note])
-        with open(self.infopath, 'w') as file:
-            json.dump(self.info, file, ensure_ascii=False, indent=4)
-        self.csession.log_message(LogLevels.LEVEL_INFO, f"[GUI]: Annotation saved - '{note}'")
+        """Append to annotations.jsonl. The collection thread merges it into info.json when the session ends."""
+        if self.csession.annotate(time, note):
+            self.log(f"[GUI]: Annotation saved - '{note}'")
 
     def on_enter_annotation(self):
-        if not self.start_time:
+        if not self.start_time or self.stop_event.is_set():
             return
         annotation = self.entry_annotation.text()
         timestamp = round((datetime.now() - self.start_time).total_seconds(), 2)
@@ -583,24 +554,31 @@ class CollectionWindow(PageWindow):
         elif self.stimcycle[self.current_block-1] == '0' and self.state_indicator.is_active():
             self.state_indicator.set_active(False)
 
-    def update_timer(self):
-        if self.error_flag.is_set():
-            self.status_panel.set_session_status(self.csession.get_error(), error=True)
-            self.stop_session()
-            return
+    def schedule_tick(self):
+        """Arm the clock for the next whole second of the session. Deadlines are measured from the start, so
+        ticks do not drift and block changes and the session end land on their exact second."""
+        elapsed = monotonic() - self.clock_start
+        self.timer.start(max(0, round((int(elapsed) + 1 - elapsed) * 1000)))
 
-        elapsed_time = datetime.now() - self.start_time
-        elapsed_seconds = int(elapsed_time.total_seconds())
+    def update_timer(self):
+        """One tick per session second: refresh the clocks and block display, and stop after the last block"""
+        elapsed_seconds = int(monotonic() - self.clock_start + 0.005)  # A tick may fire a few ms early
         remaining_seconds = max(0, self.blength - (elapsed_seconds % self.blength))
         formatted_time = QTime(0, 0).addSecs(remaining_seconds).toString("mm:ss")
         self.status_panel.set_block_time(formatted_time)
         self.status_panel.set_session_time(QTime(0, 0).addSecs(elapsed_seconds).toString("mm:ss"))
 
+        self.status_panel.set_lost(self.csession.integrity.lost)
+        block = self.current_block
+        self.update_block(elapsed_seconds)  # Before update_status, which shows the block this tick starts
+        if self.current_block != block:
+            self.csession.mark(f"Block{self.current_block}", "block")
         self.update_status()
-        self.update_block(elapsed_time)
+        if not self.stop_event.is_set():
+            self.schedule_tick()
 
     def update_block(self, elapsed):
-        self.current_block = int(elapsed.total_seconds() / self.blength) + 1
+        self.current_block = elapsed // self.blength + 1
         if self.current_block > self.bcount:
             self.session_status = "Complete"
             self.current_block = self.bcount
@@ -610,19 +588,23 @@ class CollectionWindow(PageWindow):
     def start_session(self):
         if not self.ready_flag.is_set():
             return
-        ongoing_thread = Thread(target=self.show_ongoing, name="OngoingThread")
-        ongoing_thread.start()
+        self.start_time = datetime.now()
+        self.csession.clock.origin = self.start_time.timestamp()  # Annotation times count from here
         self.start_event.set()
+        self.csession.mark("Block1", "block")
         self.current_block = 1
-        self.start_time = datetime.now()
+        self.clock_start = monotonic()
         self.timer.timeout.connect(self.update_timer)
-        self.timer.start(10)  # Timer interval in milliseconds
+        self.schedule_tick()
         self.entry_button.setDisabled(False)
+        self.entry_annotation.clear()  # Disabled when the previous session on this board stopped
+        self.entry_annotation.setPlaceholderText(f"t{self.t}")
+        self.entry_annotation.setDisabled(False)
         self.start_button.setDisabled(True)
         self.stop_button.setDisabled(False)
         if self.stim:
             self.stim.show()
-            self.csession.log_message(LogLevels.LEVEL_INFO, f"[GUI]: {type(self.stim).__name__} launched.")
+            self.log(f"[GUI]: {type(self.stim).__name__} launched.")
 
     def new_session(self):
         self.goto("info", True)
@@ -641,11 +623,13 @@ class CollectionWindow(PageWindow):
 
     def pause_stream(self):
         self.stop_event.set()
+        self.status_timer.stop()
         self.log_panel.end_log()
         self.timer.stop()
         self.state_indicator.set_active(False)
         self.stop_button.setDisabled(True)
         self.entry_button.setDisabled(True)
+        self.entry_annotation.setDisabled(True)
         if not self.error_flag.is_set():
             self.set_start_mode('New Session')
             self.status_panel.set_session_status("Complete", error=False)
@@ -654,18 +638,24 @@ class CollectionWindow(PageWindow):
         if self.stim:
             self.stim.close()
 
+    @pyqtSlot(str)
+    def mark_onset(self, label):
+        self.csession.mark(label, "stimulus")
+
     def end_stim(self):
         self.stim.close()
-        self.csession.log_message(LogLevels.LEVEL_INFO, f"[GUI]: {type(self.stim).__name__} closed.")
+        self.log(f"[GUI]: {type(self.stim).__name__} closed.")
         self.pause_stream()
 
     def stop_session(self):
         self.stop_event.set()
+        self.status_timer.stop()
         self.log_panel.end_log()
         self.timer.stop()
         self.state_indicator.set_active(False)
         self.stop_button.setDisabled(True)
         self.entry_button.setDisabled(True)
+        self.entry_annotation.setDisabled(True)
         if self.error_flag.is_set():
             self.status_panel.set_session_status(self.csession.get_error(), error=True)
         else:
@@ -717,10 +707,12 @@ class InfoPanel(QFrame):
 
 class StatusPanel(QFrame):
     def __init__(self, status_label, status_info, block_status, 
-                 block_timer, session_timer, state_indicator, infslabel):
+                 block_timer, session_timer, state_indicator, infslabel, lost_label):
         super().__init__()
         self.setFrameStyle(QFrame.Panel | QFrame.Plain)
         self.status_info = status_info
+        self.lost_label = lost_label
+        self.lost = None
         self.btimer = block_timer
         self.stimer = session_timer
         self.state_indicator = state_indicator
@@ -736,6 +728,7 @@ class StatusPanel(QFrame):
         layout.addWidget(session_timer, 0, 2, Qt.AlignTop | Qt.AlignRight)
         layout.addWidget(infslabel, 2, 0, 1, 2, Qt.AlignBottom | Qt.AlignLeft)
         layout.addWidget(status_info, 2, 2, 1, 2, Qt.AlignBottom | Qt.AlignLeft)
+        layout.addWidget(lost_label, 3, 0, 1, 3, Qt.AlignBottom | Qt.AlignLeft)
     
     def set_session_status(self, status, error=False):
         """Set label next to Session Status"""
@@ -758,6 +751,12 @@ class StatusPanel(QFrame):
     def set_active(self, active):
         self.state_indicator.set_active(active)
 
+    def set_lost(self, count):
+        """Show the running count of samples detected as lost"""
+        if count != self.lost:
+            self.lost = count
+            self.lost_label.setText(f"Samples lost: {count}")
+
 
 def init_logbox(ipath, session):
     """Pass logfile to BoardShim and set up for GUI log window"""
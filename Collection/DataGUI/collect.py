@@ -0,0 +1,190 @@
+"""Headless data collection: runs a session from the command line without the Qt GUI"""
+from brainflow import BrainFlowInputParams, BrainFlowError, LogLevels
+from brainflow.board_shim import BoardShim
+from BoardBridge import CollectionSession
+from Protocol import Protocol, ProtocolSession
+from SessionInfo import BOARDMAP, BUFFSIZE_DEFAULT, check_fields, create_empty_info, create_session, fill_info
+from SessionWriter import ROW_GROUPS
+from time import monotonic
+
+import argparse
+import json
+import numpy as np
+import os
+import sys
+
+SYNTHETIC_BOARD = -1
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='collect.py',
+                                     description='Runs a data collection session without the GUI. Fields not given '
+                                                 'as arguments are read from --info.')
+    parser.add_argument('directory', help="Directory in which the session folder is created")
+    parser.add_argument('-i', '--info', help="info.json (or template) to take session fields from")
+    parser.add_argument('--subject', help="Subject name")
+    parser.add_argument('--project', help="Project name")
+    parser.add_argument('--response-type', help="SSVEP, ERP, or other")
+    parser.add_argument('--stimulus-type', help="visual, audio, or other")
+    parser.add_argument('--block-length', help="Block length in seconds")
+    parser.add_argument('--block-count', help="Number of blocks")
+    parser.add_argument('--stim-cycle', help="Stimulus cycle, e.g. 10101")
+    parser.add_argument('--description', help="Session description")
+    parser.add_argument('--config', help="Headset configuration (Standard, Occipital, Other)")
+    parser.add_argument('--model', choices=list(BOARDMAP), help="Headset model")
+    parser.add_argument('--buffer-size', help=f"Board buffer size in samples (default {BUFFSIZE_DEFAULT})")
+    parser.add_argument('--serial-port', help="Board serial port, e.g. COM4 or /dev/ttyUSB0")
+    parser.add_argument('--synthetic', action='store_true', help="Record from BrainFlow's synthetic board instead")
+    parser.add_argument('--rows', help=f"Row groups to store, comma separated ({', '.join(ROW_GROUPS)}). Default all.")
+    parser.add_argument('--dtype', choices=("float64", "float32"), default="float64", help="Storage type")
+    parser.add_argument('--memory-seconds', type=float, help="Keep only this much recent data in RAM")
+    parser.add_argument('--codec', choices=("zlib", "bz2", "lzma"), help="Compress data.bin losslessly")
+    parser.add_argument('--publish', help="Shared memory name to publish live samples under")
+    parser.add_argument('--serve', help="host:port or Unix socket path to stream live samples on")
+    parser.add_argument('--trials', type=int, help="Run a sample-exact protocol of this many trials, each one "
+                                                   "stim cycle long")
+    parser.add_argument('--block-samples', type=int, help="Protocol block length in samples (default: block length "
+                                                          "times the sampling rate)")
+    parser.add_argument('--break-seconds', type=float, default=0, help="Protocol break between trials")
+    parser.add_argument('--sync-every', type=int, default=1, help="Drains between fsyncs of data.bin and the journal "
+                                                                  "(0: time trigger only)")
+    parser.add_argument('--sync-interval', type=float, default=5.0, help="Longest seconds between fsyncs "
+                                                                         "(0: drain count trigger only)")
+    parser.add_argument('--flush-every', type=int, default=1, help="Drains between flushes of data.bin to the OS")
+    parser.add_argument('--fsync', action='store_true', help="Also fsync data.bin on every flush")
+    parser.add_argument('--progress', type=float, default=1.0, help="Seconds between progress lines")
+    return parser.parse_args(argv)
+
+
+def build_info(args):
+    """Merge --info with the command line fields, validate them and return (info, rowgroups, protocol, board id)
+    or exit"""
+    info = create_empty_info()
+    if args.info:
+        with open(args.info) as f:
+            loaded = json.load(f)
+        for key in ('SessionParams', 'HardwareParams'):
+            info[key].update({k: str(v) for k, v in loaded.get(key, {}).items()})
+        info['Description'] = loaded.get('Description', "")
+    sp, hp = info['SessionParams'], info['HardwareParams']
+    fields = {
+        "subject": args.subject or sp['SubjectName'],
+        "project": args.project or sp['ProjectName'],
+        "rtype": args.response_type or sp['ResponseType'] or "SSVEP",
+        "stype": args.stimulus_type or sp['StimulusType'] or "visual",
+        "blength": args.block_length or sp['BlockLength'],
+        "bcount": args.block_count or sp['BlockCount'],
+        "stimcycle": args.stim_cycle or sp['StimCycle'],
+        "config": args.config or hp['HeadsetConfiguration'] or "Standard",
+        "model": args.model or hp['HeadsetModel'] or "CytonDaisy",
+        "buffsize": args.buffer_size or hp['BufferSize'] or str(BUFFSIZE_DEFAULT),
+        "description": args.description or info['Description'],
+    }
+    model = fields['model'] if fields['model'] in BOARDMAP else "CytonDaisy"  # Unknown models rejected below
+    board_id = SYNTHETIC_BOARD if args.synthetic else BOARDMAP[model][0]
+    srate = BoardShim.get_sampling_rate(board_id)
+    if args.block_samples:  # Validated as whole seconds, replaced by the exact length below
+        fields['blength'] = str(max(1, round(args.block_samples / srate)))
+    serialport = "synthetic" if args.synthetic else (args.serial_port or "")
+    valid, error = check_fields(args.directory, fields['subject'], fields['project'], fields['blength'],
+                                fields['bcount'], fields['stimcycle'], fields['description'], fields['buffsize'],
+                                serialport)
+    if valid and not args.synthetic and fields['model'] not in BOARDMAP:
+        valid, error = False, f"Unknown headset model {fields['model']}."
+    if not valid:
+        sys.exit(f"Error: {error}")
+    if args.synthetic:  # Describe the board actually recorded, as data.json does
+        fields['model'] = "Synthetic"
+    rowgroups = tuple(g.strip() for g in args.rows.split(",")) if args.rows else None
+    if rowgroups and (unknown := set(rowgroups) - set(ROW_GROUPS)):
+        sys.exit(f"Error: Unknown row groups {', '.join(sorted(unknown))}.")
+    protocol = None
+    if args.trials or args.block_samples:
+        if (args.trials or 1) < 1 or (args.block_samples is not None and args.block_samples < 1):
+            sys.exit("Error: Trials and block samples must be positive.")
+        protocol = Protocol(args.block_samples or int(fields['blength']) * srate, fields['stimcycle'].strip(),
+                            args.trials or 1, round(args.break_seconds * srate))
+    fill_info(info, rowgroups=rowgroups, dtype=args.dtype, annotate_blocks=protocol is None, srate=srate, **fields)
+    if protocol:
+        protocol.fill_info(info, srate)
+    return info, rowgroups, protocol, board_id
+
+
+def wait_ready(session):
+    """Block until the board is prepared. Returns False if preparation failed."""
+    while not session.ready_flag.wait(0.5):
+        if session.error_flag.is_set() or not session.is_alive():
+            return False
+    return True
+
+
+def run(args):
+    info, rowgroups, protocol, board_id = build_info(args)
+    sespath = create_session(args.directory, info)
+    print(f"Session directory: {sespath}", flush=True)
+
+    params = BrainFlowInputParams()
+    params.serial_port = args.serial_port or ""
+    try:
+        board = BoardShim(board_id, params)
+    except BrainFlowError as E:
+        sys.exit(f"Error creating BoardShim object.\n{E}")
+    if min(args.sync_every, args.sync_interval, args.flush_every) < 0:
+        sys.exit("Error: Sync and flush cadences cannot be negative.")
+    options = dict(codec=args.codec, rowgroups=rowgroups, dtype=np.dtype(args.dtype),
+                   memory_seconds=args.memory_seconds, publish=args.publish, serve=args.serve,
+                   sync_every=args.sync_every, sync_interval=args.sync_interval, flush_every=args.flush_every,
+                   fsync=args.fsync, max_latency=min(args.progress, 5.0))  # Drain at least once per progress line
+    buffsize = int(info['HardwareParams']['BufferSize'])
+    if protocol:
+        session = ProtocolSession(board, sespath, buffsize, protocol, **options)
+    else:
+        session = CollectionSession(board, sespath, buffsize, **options)
+    session.activate_logger(os.path.join(sespath, "sessionlog.log"))
+
+    print("Preparing board...", flush=True)
+    session.start()
+    if not wait_ready(session):
+        session.join()
+        sys.exit(session.get_error() or "Error: Board preparation failed.")
+
+    blength = float(info['SessionParams']['BlockLength'])
+    bcount = int(info['SessionParams']['BlockCount'])
+    stimcycle = info['SessionParams']['StimCycle']
+    # Protocol sessions stop themselves after their last sample, others after blength * bcount seconds
+    duration = float("inf") if protocol else blength * bcount
+    session.start_event.set()
+    start = monotonic()
+    if protocol:
+        print(f"Collecting {protocol.trials} trials of {len(protocol.stimcycle)} blocks of {protocol.block_samples} "
+              f"samples ({protocol.stimcycle}), {protocol.total} samples. Ctrl+C stops early.", flush=True)
+    else:
+        print(f"Collecting {bcount} blocks of {blength:g}s ({stimcycle}). Ctrl+C stops early.", flush=True)
+    try:
+        while not (session.error_flag.is_set() or session.stop_event.is_set()) and \
+                (elapsed := monotonic() - start) < duration:
+            if protocol:
+                block = protocol.locate(session.samples) or protocol.blocks[-1]
+                label = f"{block.label} ({'active' if protocol.active(block) else 'inactive'})"
+            else:
+                block = min(int(elapsed // blength), bcount - 1)
+                label = f"Block {block + 1}/{bcount} ({'active' if stimcycle[block] == '1' else 'inactive'})"
+            print(f"[{int(elapsed) // 60:02d}:{int(elapsed) % 60:02d}] {label}, "
+                  f"{session.samples} samples, {session.integrity.lost} lost", flush=True)
+            session.error_flag.wait(min(args.progress, duration - elapsed))
+    except KeyboardInterrupt:
+        session.log_message(LogLevels.LEVEL_INFO, "[GUI]: Session stopped early from the command line.")
+    session.stop_event.set()
+    session.join()
+    if board.is_prepared():
+        board.release_session()
+
+    if session.state == CollectionSession.State.FAILED:
+        print(session.get_error(), file=sys.stderr)
+        return 1
+    print(f"Complete: {session.samples} samples, {session.integrity.lost} lost. Saved to {sespath}", flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run(parse_args()))
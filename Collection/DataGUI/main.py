@@ -1,8 +1,16 @@
-"""Data Collection GUI v1.0.0"""
-from PyQt5.QtCore import pyqtSlot
-from PyQt5.QtWidgets import (QApplication, QMainWindow, QStackedWidget, QSizePolicy)
-from Windows import CollectionWindow, InfoWindow, ModeWindow
-from Style import Style
+"""Data Collection GUI v1.0.0
+    --profile-startup: Print import and initialization times up to the mode window and the info window
+"""
+import sys
+
+from StartupProfile import StartupProfile
+
+profile = StartupProfile(enabled="--profile-startup" in sys.argv).install()  # Before the GUI imports it times
+
+from PyQt5.QtCore import QTimer, pyqtSlot  # noqa: E402
+from PyQt5.QtWidgets import (QApplication, QMainWindow, QStackedWidget, QSizePolicy)  # noqa: E402
+from Windows import CollectionWindow, InfoWindow, ModeWindow  # noqa: E402
+from Style import Style  # noqa: E402
 
 # Multi-page structure adapted from 
 # https://stackoverflow.com/questions/56867107/how-to-make-a-multi-page-application-in-pyqt5
@@ -29,10 +37,19 @@ class DataCollectionGUI(QMainWindow):
     def init(self, boardless=False):
         if boardless:
             self.setWindowTitle("Data Collection GUI (Boardless Mode)")
-        cwindow = CollectionWindow()
-        self.register(cwindow, 'collect')
-        self.register(InfoWindow(cwindow, boardless), 'info')
-        self.stack.setCurrentWidget(self.pages['info'])
+        with profile.phase("Collection and info windows"):
+            cwindow = CollectionWindow()
+            self.register(cwindow, 'collect')
+            self.register(InfoWindow(cwindow, boardless), 'info')
+            self.stack.setCurrentWidget(self.pages['info'])
+        QTimer.singleShot(0, self.end_profile)
+
+    @staticmethod
+    def end_profile():
+        """Report the mode switch and stop timing imports before any session thread starts"""
+        profile.report("Info window shown")
+        profile.uninstall()
+        profile.enabled = False
 
     @pyqtSlot(str, bool)
     def goto(self, name, reset=False):
@@ -54,6 +71,9 @@ class DataCollectionGUI(QMainWindow):
 
 
 if __name__ == "__main__":
-    app = QApplication([])
-    gui = DataCollectionGUI()
+    with profile.phase("QApplication"):
+        app = QApplication([])
+    with profile.phase("Mode window"):
+        gui = DataCollectionGUI()
+    QTimer.singleShot(0, lambda: profile.report("Mode window shown"))  # Runs once the event loop is up
     app.exec_()
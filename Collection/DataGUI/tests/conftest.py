@@ -0,0 +1,5 @@
+import os
+import sys
+
+# DataGUI modules import each other by flat name, as they do when main.py runs from that directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
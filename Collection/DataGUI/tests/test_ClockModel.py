@@ -0,0 +1,29 @@
+import numpy as np
+
+from ClockModel import ClockModel
+
+
+def simulated(rate=250.0, seconds=600, chunk=50):
+    model = ClockModel(250)
+    index = 0
+    while index < rate * seconds:
+        model.update(index, 1000.0 + np.arange(index, index + chunk) / rate)
+        index += chunk
+    return model
+
+
+def test_lookups_invert_each_other():
+    model = simulated(rate=250.05)
+    indices = np.array([10.0, 12345.5, 140000.0])
+    assert np.allclose(model.index(model.time(indices)), indices, atol=1e-6)
+    assert abs(model.fit()[0] - 250.05) < 1e-6
+
+
+def test_anchor_arrays_cached_until_anchor_added():
+    model = simulated(seconds=60)
+    first = model.anchors()
+    assert all(a is b for a, b in zip(model.anchors(), first))
+    model.update(15000, 1000.0 + np.arange(15000, 15500) / 250.0)
+    indices, times = model.anchors()
+    assert indices is not first[0] and len(indices) == len(model.indices) > len(first[0])
+    assert indices.dtype == times.dtype == np.float64
@@ -0,0 +1,30 @@
+import io
+
+import numpy as np
+
+from Codec import encode, iter_frames
+
+
+def frames(sizes, rows=3):
+    data = np.random.default_rng(0).normal(size=(rows, sum(sizes)))
+    stream, index = io.BytesIO(), 0
+    for n in sizes:
+        stream.write(encode(data[:, index:index + n]))
+        index += n
+    stream.seek(0)
+    return data, stream
+
+
+def test_iter_frames_range_matches_full_decode():
+    data, stream = frames([5, 7, 1, 10, 4])
+    for start, stop in [(0, 27), (3, 9), (5, 12), (12, 13), (13, 20), (26, 40), (27, 30)]:
+        stream.seek(0)
+        chunks = list(iter_frames(stream, start, stop))
+        got = np.hstack(chunks) if chunks else np.empty((3, 0))
+        assert np.array_equal(got, data[:, start:stop])
+
+
+def test_iter_frames_stops_after_range():
+    data, stream = frames([5, 5, 5])
+    list(iter_frames(stream, 0, 5))
+    assert 0 < stream.tell() < len(stream.getvalue())  # Later frames are never read
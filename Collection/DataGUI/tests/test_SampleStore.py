@@ -0,0 +1,40 @@
+import numpy as np
+
+from SampleStore import SampleStore, TailStore
+
+
+def chunk(start, n, rows=2):
+    return np.tile(np.arange(start, start + n, dtype=np.float64), (rows, 1))
+
+
+def test_full_tail_view_is_overwritten_by_next_append():
+    store = TailStore(2, 100, seconds=1)
+    store.append(chunk(0, 150))
+    first, view = store.range(0, 150)
+    assert first == 50 and view[0, 0] == 50 and store.holds(first)
+    store.append(chunk(150, 1))
+    assert not store.holds(first)
+    assert view[0, 0] == 150  # Reused ring slot, which is why holds is now False
+
+
+def test_partial_view_survives_length_minus_k_appends():
+    store = TailStore(2, 100, seconds=1)
+    store.append(chunk(0, 130))
+    first, view = store.range(90, 130)
+    expected = view.copy()
+    for i in range(60):  # length - k = 100 - 40
+        store.append(chunk(130 + i, 1))
+        assert store.holds(first)
+        assert np.array_equal(view, expected)
+    store.append(chunk(190, 1))
+    assert not store.holds(first)
+    assert not np.array_equal(view, expected)
+
+
+def test_sample_store_views_stay_valid():
+    store = SampleStore(2, 10, seconds=1)
+    store.append(chunk(0, 5))
+    view = store.latest(5)
+    store.append(chunk(5, 100))
+    assert store.holds(0) and np.array_equal(view[0], np.arange(5))
+    assert np.array_equal(store.latest(3)[0], [102, 103, 104])
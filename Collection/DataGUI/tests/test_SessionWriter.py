@@ -0,0 +1,42 @@
+import numpy as np
+from brainflow.board_shim import BoardShim
+
+from SessionWriter import BinaryWriter, CompressedWriter, WriterThread, board_header, export_csv, read_range
+
+BOARD = -1  # Synthetic board
+
+
+def write_session(path, writer_class, **kwargs):
+    rows = [BoardShim.get_eeg_channels(BOARD)[0], BoardShim.get_timestamp_channel(BOARD)]
+    header = board_header(BOARD, 250, rows, np.float32)
+    header['TimestampOrigin'] = 1.7e9
+    writer = writer_class(str(path), header, **kwargs)
+    data = np.vstack((np.arange(500.0), np.arange(500) / 250.0))
+    for start in range(0, 500, 100):
+        writer.write(data[:, start:start + 100])
+    writer.close()
+    return data
+
+
+def test_float32_timestamps_restored_on_read_and_export(tmp_path):
+    for writer_class, kwargs in ((BinaryWriter, {}), (CompressedWriter, {"coder": "zlib"})):
+        path = tmp_path / writer_class.__name__
+        path.mkdir()
+        data = write_session(path, writer_class, **kwargs)
+        expected = data[1] + 1.7e9
+        assert np.allclose(read_range(str(path), 120, 380)[1], expected[120:380], atol=1e-4)
+        exported = np.loadtxt(export_csv(str(path)))
+        assert np.allclose(exported[1], expected, atol=1e-4)
+        assert np.array_equal(exported[0], data[0])
+
+
+def test_wait_written_only_counts_flushed_samples(tmp_path):
+    header = board_header(BOARD, 250, [0, 1])
+    thread = WriterThread(BinaryWriter(str(tmp_path), header, flush_every=100))
+    thread.start()
+    for start in range(0, 300, 100):
+        thread.put(np.zeros((2, 100)) + start)
+    assert thread.wait_written(300)  # Forces a flush although flush_every was not reached
+    assert thread.writer.flushed == 300
+    assert read_range(str(tmp_path), 0, 300).shape == (2, 300)
+    thread.close()
@@ -0,0 +1,62 @@
+import socket
+import time
+
+import numpy as np
+import pytest
+
+from StreamServer import StreamServer, StreamClient
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def subscribe(server, address):
+    """Connect a client and wait until the server has registered it, so broadcasts reach it"""
+    client = StreamClient(address, timeout=5)
+    deadline = time.monotonic() + 5
+    while not server.subscribers and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return client
+
+
+def test_close_refuses_new_connections_and_frees_port():
+    address = f"127.0.0.1:{free_port()}"
+    header = {"Rows": 2, "SampleRate": 250, "DataType": "float32"}
+    server = StreamServer(address, header)
+    server.start()
+    client = subscribe(server, address)
+    assert client.header == header
+    server.broadcast(np.ones((2, 3)), 0)
+    seq, start, chunk = client.recv()
+    assert (seq, start, chunk.shape) == (0, 0, (2, 3))
+
+    server.close()
+    assert not server.is_alive()
+    assert client.recv() is None
+    client.close()
+    with pytest.raises(ConnectionRefusedError):
+        socket.create_connection(("127.0.0.1", server.address[1]), timeout=5)
+
+    again = StreamServer(address, header)
+    again.start()
+    again.close()
+
+
+def test_dropped_slow_subscriber_thread_exits():
+    address = f"127.0.0.1:{free_port()}"
+    server = StreamServer(address, {"Rows": 32, "SampleRate": 250, "DataType": "float64"}, maxsize=2)
+    server.start()
+    client = subscribe(server, address)  # Never reads, so sendall blocks once the socket buffers fill
+    sub = server.subscribers[0]
+    deadline = time.monotonic() + 5
+    frame = np.ones((32, 20000))
+    while not server.dropped and time.monotonic() < deadline:
+        server.broadcast(frame, 0)
+    assert server.dropped == 1
+    sub.join(timeout=2)
+    assert not sub.is_alive()
+    client.close()
+    server.close()
@@ -10,9 +10,11 @@ from datetime import datetime, timedelta
 DATASET = "neurotechxcolumbia dataset"
 INFO_TABLE = f"matheu_campbell.neurotechxcolumbia_dataset.info_table:rx53"
 DATA_TABLE = "data_table"
-HPARAMS = ("SampleRate", "HeadsetConfiguration", "HeadsetModel", "BufferSize")
+HPARAMS = ("SampleRate", "HeadsetConfiguration", "HeadsetModel", "BufferSize", "RowGroups", "DataType",
+           "TimestampOrigin")
 SPARAMS = ("ProjectName", "SubjectName", "ResponseType", "StimulusType",
            "BlockLength", "BlockCount", "StimCycle")
+NESTED = ("Integrity", "Markers", "Clock")  # Summary sections stored as prefixed columns, e.g. MarkersCount
 
 
 def listify(annotations):
@@ -27,7 +29,7 @@ def listify(annotations):
 def reconstruct_info(row):
     out = {'HardwareParams': {}, 'SessionParams': {}}
     for key, val in row.items():
-        if key == 'Annotations':
+        if key in ('Annotations', 'BlockSamples'):
             out[key] = listify(val)
         elif key in HPARAMS:
             out['HardwareParams'][key] = val
@@ -35,6 +37,8 @@ def reconstruct_info(row):
             out['SessionParams'][key] = val
         elif key[0] == "_":
             continue
+        elif section := next((name for name in NESTED if key.startswith(name)), None):
+            out.setdefault(section, {})[key[len(section):]] = val
         else:
             out[key] = val
     return out
@@ -10,12 +10,18 @@ import os
 import redivis
 import sys
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "Collection", "DataGUI"))
+from SessionInfo import ANNOTATIONS_NAME, read_annotations  # noqa: E402
+from SessionWriter import export_csv  # noqa: E402
+
 DATASET = "neurotechxcolumbia dataset"
 INFO_TABLE = "info_table"
 DATA_TABLE = "data_table"
-HPARAMS = ("SampleRate", "HeadsetConfiguration", "HeadsetModel", "BufferSize")
+HPARAMS = ("SampleRate", "HeadsetConfiguration", "HeadsetModel", "BufferSize", "RowGroups", "DataType",
+           "TimestampOrigin")
 SPARAMS = ("ProjectName", "SubjectName", "ResponseType", "StimulusType",
            "BlockLength", "BlockCount", "StimCycle")
+NESTED = ("Integrity", "Markers", "Clock")  # Summary sections stored as prefixed columns, e.g. MarkersCount
 
 
 def verify_json(json: dict):
@@ -53,16 +59,16 @@ def dictify(annotations):
     return out
 
 
-def flatten(dct):
+def flatten(dct, prefix=""):
+    """One column per field. Fields of the NESTED summary sections are prefixed with the section name."""
     flat = {}
     for key, val in dct.items():
         if isinstance(val, dict):
-            for k, v in flatten(val).items():
-                flat[k] = v
+            flat.update(flatten(val, key if key in NESTED else ""))
         elif isinstance(val, list):
-            flat[key] = str(dictify(val)).replace("'", '"')
+            flat[prefix + key] = str(dictify(val)).replace("'", '"')
         else:
-            flat[key] = val
+            flat[prefix + key] = val
     return flat
 
 
@@ -107,12 +113,19 @@ if not os.path.exists(info_path):
     print(f"Error: Info file not found in session directory.")
     sys.exit(1)
 
+if not os.path.exists(data_path) and os.path.exists(os.path.join(session_path, "data.bin")):
+    print("Converting data.bin to data.csv.")
+    export_csv(session_path)  # Compressed sessions are decoded frame by frame
+
 if not os.path.exists(data_path):
     print(f"Error: Data file not found in session directory.")
     sys.exit(1)
 
 with open(info_path) as fileinfo:
     info = json.loads(fileinfo.read())
+if pending := read_annotations(session_path):
+    print(f"Merging {len(pending)} annotations from {ANNOTATIONS_NAME}.")
+    info['Annotations'] = info.get('Annotations', []) + pending
 
 # Confirm info JSON contains the right fields.
 if not verify_json(info):